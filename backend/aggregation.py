@@ -0,0 +1,55 @@
+# Дневная агрегация 3-часовых прогнозов провайдера (ForecastSeries) за один проход.
+# День и час берём из dt (UTC), строку даты строим только для выбранной записи.
+from forecast_model import format_dt
+
+SECONDS_PER_DAY = 86400
+NOON = 12
+
+
+def aggregate_daily(series):
+    # Для каждого дня: запись ближайшая к 12:00, min/max/среднее температуры
+    # и самое частое описание. Дни идут в порядке появления в списке.
+    days = {}
+    for index, (dt, temp, description) in enumerate(zip(series.dt, series.temp, series.description)):
+        day_key = dt // SECONDS_PER_DAY
+        distance = abs(NOON - dt % SECONDS_PER_DAY // 3600)
+        day = days.get(day_key)
+        if day is None:
+            days[day_key] = {
+                "noon": index,
+                "noon_distance": distance,
+                "min": temp,
+                "max": temp,
+                "sum": temp,
+                "count": 1,
+                "descriptions": {description: 1},
+            }
+            continue
+        if distance < day["noon_distance"]:
+            day["noon"] = index
+            day["noon_distance"] = distance
+        if temp < day["min"]:
+            day["min"] = temp
+        elif temp > day["max"]:
+            day["max"] = temp
+        day["sum"] += temp
+        day["count"] += 1
+        descriptions = day["descriptions"]
+        descriptions[description] = descriptions.get(description, 0) + 1
+
+    daily = []
+    for day in days.values():
+        noon = day["noon"]
+        descriptions = day["descriptions"]
+        daily.append({
+            "dt": series.dt[noon],
+            "date": format_dt(series.dt[noon]),
+            "temperature": series.temp[noon],
+            "description": series.description[noon],
+            "icon": series.icon[noon],
+            "temp_min": day["min"],
+            "temp_max": day["max"],
+            "temp_avg": round(day["sum"] / day["count"], 2),
+            "dominant_description": max(descriptions, key=descriptions.get),
+        })
+    return daily
@@ -0,0 +1,64 @@
+# Дневная агрегация: прежний цикл со strptime против однопроходного aggregate_daily
+# на синтетических ответах провайдера (40 записей × BENCH_CITIES городов).
+#
+#   cd backend && python benchmarks/bench_aggregation.py
+import os
+import sys
+import time
+from collections import Counter
+from datetime import datetime
+from statistics import mean
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from aggregation import aggregate_daily  # noqa: E402
+from forecast_model import ForecastSeries  # noqa: E402
+from benchmarks.stub_provider import make_forecast_payload  # noqa: E402
+
+CITIES = int(os.getenv("BENCH_CITIES", "2000"))
+
+
+def compact(data):
+    return [
+        {"dt": i["dt"], "dt_txt": i["dt_txt"], "temp": i["main"]["temp"],
+         "description": i["weather"][0]["description"], "icon": i["weather"][0]["icon"]}
+        for i in data["list"]
+    ]
+
+
+def legacy_aggregate(items):
+    # Алгоритм до перехода на aggregation.py: strptime дважды на запись плюс повторный проход
+    forecast_dict = {}
+    for item in items:
+        forecast_date = datetime.strptime(item["dt_txt"], "%Y-%m-%d %H:%M:%S")
+        day_key = forecast_date.strftime("%Y-%m-%d")
+        if day_key not in forecast_dict:
+            forecast_dict[day_key] = item
+        current_hour = forecast_date.hour
+        existing_hour = datetime.strptime(forecast_dict[day_key]["dt_txt"], "%Y-%m-%d %H:%M:%S").hour
+        if abs(12 - current_hour) < abs(12 - existing_hour):
+            forecast_dict[day_key] = item
+    forecast_list = [
+        {"date": i["dt_txt"], "temperature": i["temp"], "description": i["description"], "icon": i["icon"]}
+        for i in forecast_dict.values()
+    ]
+    first_day_str = forecast_list[0]["date"].split(" ")[0]
+    first_day = [f for f in forecast_list if f["date"].startswith(first_day_str)]
+    mean([f["temperature"] for f in first_day])
+    Counter([f["description"] for f in first_day]).most_common(1)
+    return forecast_list
+
+
+def measure(name, fn, payloads):
+    started = time.perf_counter()
+    for items in payloads:
+        fn(items)
+    elapsed = time.perf_counter() - started
+    print(f"{name:<18} {len(payloads) / elapsed:10.0f} payloads/s {elapsed / len(payloads) * 1e6:8.1f} us/payload")
+
+
+if __name__ == "__main__":
+    payloads = [compact(make_forecast_payload(f"City{i}")) for i in range(CITIES)]
+    print(f"{CITIES} cities x {len(payloads[0])} items")
+    measure("legacy (strptime)", legacy_aggregate, payloads)
+    measure("aggregate_daily", aggregate_daily, [ForecastSeries.from_items(items) for items in payloads])
@@ -0,0 +1,63 @@
+# Сравнение кодека кэша/истории (v1, JSON) со старым форматом str(dict) + ast.literal_eval,
+# для прогноза — ещё и с колоночным форматом v2: скорость кодирования/декодирования и размер значения.
+#
+#   cd backend && python benchmarks/bench_codec.py
+import ast
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import codec  # noqa: E402
+from benchmarks.stub_provider import make_forecast_payload  # noqa: E402
+
+ROUNDS = int(os.getenv("BENCH_ROUNDS", "2000"))
+
+
+def provider_payload():
+    data = make_forecast_payload("Moscow")
+    return {
+        "city": "Moscow",
+        "country": "RU",
+        "list": [
+            {"dt": item["dt"], "dt_txt": item["dt_txt"], "temp": item["main"]["temp"],
+             "description": item["weather"][0]["description"], "icon": item["weather"][0]["icon"]}
+            for item in data["list"]
+        ],
+    }
+
+
+HISTORY_ENTRY = {
+    "city": "Moscow", "forecast_date": "2025-04-13", "avg_temperature": 7.41,
+    "description": "переменная облачность", "icon": "03d", "request_time": "2025-04-13T14:52:05.083339Z",
+}
+
+
+def run(name, value):
+    legacy = str(value)
+    encoded = codec.encode(value)
+    cases = [
+        ("legacy encode", lambda: str(value)),
+        ("legacy decode", lambda: ast.literal_eval(legacy)),
+        ("v1 encode", lambda: codec.encode(value)),
+        ("v1 decode", lambda: codec.decode(encoded)),
+    ]
+    sizes = f"legacy {len(legacy.encode())} bytes, v1 {len(encoded.encode())} bytes"
+    if "list" in value:
+        forecast = codec.decode_forecast(encoded)
+        encoded_v2 = codec.encode_forecast(forecast)
+        cases += [
+            ("v2 encode", lambda: codec.encode_forecast(forecast)),
+            ("v2 decode", lambda: codec.decode_forecast(encoded_v2)),
+        ]
+        sizes += f", v2 {len(encoded_v2.encode())} bytes"
+    print(f"{name}: {sizes} ({'orjson' if codec.orjson else 'json'})")
+    for label, fn in cases:
+        seconds = timeit.timeit(fn, number=ROUNDS)
+        print(f"  {label:<14} {ROUNDS / seconds:12.0f} ops/s {seconds / ROUNDS * 1e6:8.2f} us/op")
+
+
+if __name__ == "__main__":
+    run("provider payload (40 items)", provider_payload())
+    run("history entry", HISTORY_ENTRY)
@@ -0,0 +1,67 @@
+# Проверяет, что попадания в кэш не ждут медленных промахов к провайдеру.
+# Нужен запущенный Redis (docker compose up redis), OpenWeatherMap заменяется
+# локальной заглушкой с задержкой STUB_LATENCY.
+#
+#   cd backend && REDIS_HOST=localhost REDIS_PORT=6379 python benchmarks/bench_forecast_latency.py
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+STUB_PORT = int(os.getenv("STUB_PORT", "9001"))
+os.environ.setdefault("OPENWEATHERMAP_API_KEY", "bench")
+os.environ["OPENWEATHERMAP_BASE_URL"] = f"http://127.0.0.1:{STUB_PORT}"
+
+import httpx  # noqa: E402
+
+from benchmarks.stub_provider import run_in_thread  # noqa: E402
+
+HOT_CITY = "BenchHot"
+MISSES = int(os.getenv("BENCH_MISSES", "50"))
+HITS = int(os.getenv("BENCH_HITS", "200"))
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def timed_get(client, url):
+    started = time.perf_counter()
+    response = await client.get(url)
+    response.raise_for_status()
+    return time.perf_counter() - started
+
+
+async def run():
+    import main
+
+    transport = httpx.ASGITransport(app=main.app)
+    # startup/shutdown приложения: подключения к Redis и провайдеру создаются в lifespan
+    async with main.app.router.lifespan_context(main.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            await timed_get(client, f"/forecast/{HOT_CITY}")
+
+            baseline = [await timed_get(client, f"/forecast/{HOT_CITY}") for _ in range(HITS)]
+
+            run_id = int(time.time())
+            misses = [asyncio.create_task(timed_get(client, f"/forecast/BenchCold{run_id}-{i}")) for i in range(MISSES)]
+            await asyncio.sleep(0)
+            under_load = await asyncio.gather(*[timed_get(client, f"/forecast/{HOT_CITY}") for _ in range(HITS)])
+            miss_latency = await asyncio.gather(*misses)
+
+    def report(name, values):
+        print(f"{name:<24} n={len(values):<5} p50={statistics.median(values) * 1000:8.2f}ms "
+              f"p99={percentile(values, 99) * 1000:8.2f}ms max={max(values) * 1000:8.2f}ms")
+
+    report("cache hit (idle)", baseline)
+    report("cache hit (under misses)", under_load)
+    report("cache miss", miss_latency)
+
+
+if __name__ == "__main__":
+    run_in_thread(STUB_PORT)
+    asyncio.run(run())
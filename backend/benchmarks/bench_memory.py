@@ -0,0 +1,142 @@
+# Память на закэшированный город и размер ответа: прежний формат прогноза (v1, список словарей)
+# против колоночного (v2, forecast_model.ForecastSeries) на синтетических ответах провайдера.
+#
+#   - Redis: значения обоих форматов пишутся под ключи bench_memory:v1:* / bench_memory:v2:*,
+#     по каждому ключу берётся MEMORY USAGE (на сервере без этой команды — STRLEN значения,
+#     без накладных расходов Redis; версия сервера и аллокатор печатаются рядом с числами);
+#     ключи удаляются в конце;
+#   - процесс: объём декодированных записей (как их держит локальный кэш) по tracemalloc;
+#   - ответ /forecast/{city}?days=7: JSON полного и compact формата, без сжатия и с gzip.
+#
+#   cd backend && REDIS_HOST=localhost python benchmarks/bench_memory.py --cities 10000
+import argparse
+import gzip
+import json
+import os
+import sys
+import tracemalloc
+
+import redis
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import codec  # noqa: E402
+from aggregation import aggregate_daily  # noqa: E402
+from benchmarks.stub_provider import make_forecast_payload  # noqa: E402
+from forecast_model import compact_forecast  # noqa: E402
+
+KEY_PREFIX = "bench_memory:"
+
+
+def v1_payload(city):
+    # Формат записи до перехода на колонки
+    data = make_forecast_payload(city)
+    return {
+        "id": data["city"]["id"],
+        "city": city,
+        "country": data["city"]["country"],
+        "list": [
+            {"dt": item["dt"], "dt_txt": item["dt_txt"], "temp": item["main"]["temp"],
+             "description": item["weather"][0]["description"], "icon": item["weather"][0]["icon"]}
+            for item in data["list"]
+        ],
+        "fetched_at": 1700000000.0,
+    }
+
+
+def redis_usage(redis_client, values, name, batch_size=1000):
+    keys = [f"{KEY_PREFIX}{name}:{i}" for i in range(len(values))]
+    try:
+        for start in range(0, len(keys), batch_size):
+            with redis_client.pipeline(transaction=False) as pipe:
+                for key, value in zip(keys[start:start + batch_size], values[start:start + batch_size]):
+                    pipe.set(key, value)
+                pipe.execute()
+        try:
+            usage = _per_key(redis_client, keys, "memory_usage", batch_size)
+            method = "MEMORY USAGE"
+        except (redis.exceptions.ResponseError, redis.exceptions.ConnectionError):
+            usage = _per_key(redis_client, keys, "strlen", batch_size)
+            method = "STRLEN"
+    finally:
+        for start in range(0, len(keys), batch_size):
+            redis_client.delete(*keys[start:start + batch_size])
+    return sum(usage), method
+
+
+def _per_key(redis_client, keys, command, batch_size):
+    usage = []
+    for start in range(0, len(keys), batch_size):
+        with redis_client.pipeline(transaction=False) as pipe:
+            for key in keys[start:start + batch_size]:
+                getattr(pipe, command)(key)
+            usage.extend(pipe.execute())
+    return usage
+
+
+def server_info(redis_client):
+    # Версия и аллокатор: от них зависит MEMORY USAGE (jemalloc и libc округляют по-разному)
+    try:
+        version = redis_client.info("server")["redis_version"]
+        allocator = redis_client.info("memory").get("mem_allocator", "?")
+    except (redis.exceptions.ResponseError, redis.exceptions.ConnectionError):
+        return "server without INFO"
+    return f"{version} ({allocator})"
+
+
+def decoded_size(values, decode):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    decoded = [decode(value) for value in values]
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del decoded
+    return size
+
+
+def response_sizes(payload):
+    forecast = {"city": payload["city"], "country": payload["country"], "fromCache": True, "stale": False}
+    full = {**forecast, "forecast": aggregate_daily(payload["series"])[:7]}
+    compact = {**full, "forecast": compact_forecast(full["forecast"]), "format": "compact"}
+    sizes = {}
+    for name, body in (("full", full), ("compact", compact)):
+        raw = json.dumps(body, ensure_ascii=False).encode()
+        sizes[name] = (len(raw), len(gzip.compress(raw)))
+    return sizes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cache memory per city and response size: v1 vs v2 forecast format")
+    parser.add_argument("--cities", type=int, default=10000)
+    parser.add_argument("--no-redis", action="store_true", help="skip the Redis MEMORY USAGE measurement")
+    args = parser.parse_args()
+
+    payloads = [v1_payload(f"City{i}") for i in range(args.cities)]
+    v1_values = [codec.encode(payload) for payload in payloads]
+    v2_values = [codec.encode_forecast(codec.decode_forecast(value)) for value in v1_values]
+    n = args.cities
+    print(f"{n} cities x {len(payloads[0]['list'])} items")
+
+    print(f"{'':<24}{'v1 (list)':>14}{'v2 (columns)':>14}")
+    print(f"{'value, bytes/city':<24}{sum(map(len, v1_values)) / n:14.0f}{sum(map(len, v2_values)) / n:14.0f}")
+    if not args.no_redis:
+        redis_client = redis.Redis(host=os.getenv("REDIS_HOST", "localhost"), port=int(os.getenv("REDIS_PORT", "6379")))
+        try:
+            v1_usage, method = redis_usage(redis_client, v1_values, "v1")
+            v2_usage, _ = redis_usage(redis_client, v2_values, "v2")
+            print(f"Redis {server_info(redis_client)}, {method}:")
+            print(f"{'Redis ' + method + '/city':<24}{v1_usage / n:14.0f}{v2_usage / n:14.0f}")
+            print(f"{'Redis total, MiB':<24}{v1_usage / 2 ** 20:14.1f}{v2_usage / 2 ** 20:14.1f}")
+        finally:
+            redis_client.close()
+    print(f"{'decoded, bytes/city':<24}{decoded_size(v1_values, codec.decode) / n:14.0f}"
+          f"{decoded_size(v2_values, codec.decode_forecast) / n:14.0f}")
+
+    sizes = response_sizes(codec.decode_forecast(v2_values[0]))
+    print(f"\nresponse days=7{'raw':>13}{'gzip':>14}")
+    for name, (raw, gzipped) in sizes.items():
+        print(f"{name:<16}{raw:12d}{gzipped:14d}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+# Пропускная способность бэкенда при 1 и N воркерах gunicorn (uvicorn workers).
+#
+# Для каждого значения --workers поднимается gunicorn -c gunicorn.conf.py main:app,
+# провайдер — заглушка benchmarks/stub_provider.py в отдельном процессе, нагрузка —
+# benchmarks/loadtest.py --url в --clients процессах (один процесс-клиент сам
+# упирается в одно ядро). Нужен настоящий Redis (REDIS_HOST/REDIS_PORT): fakeredis
+# в одном процессе стал бы узким местом и исказил бы сравнение.
+#
+#   cd backend && REDIS_HOST=localhost python benchmarks/bench_workers.py --workers 1 4
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, BACKEND_DIR)
+
+from benchmarks.loadtest import free_port  # noqa: E402
+
+
+def wait_until_up(url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up in {timeout}s")
+
+
+def run_clients(args, url, workdir):
+    # Запросы делятся поровну между процессами-клиентами; req/s складываются, задержки — худший процесс
+    outputs = [os.path.join(workdir, f"client-{i}.json") for i in range(args.clients)]
+    procs = [
+        subprocess.Popen([
+            sys.executable, os.path.join(BACKEND_DIR, "benchmarks", "loadtest.py"),
+            "--url", url, "--workload", args.workload, "--requests", str(args.requests // args.clients),
+            "--concurrency", str(args.concurrency), "--cities", str(args.cities), "--seed", str(i),
+            "--output", output,
+        ], cwd=BACKEND_DIR, stdout=subprocess.DEVNULL)
+        for i, output in enumerate(outputs)
+    ]
+    for proc in procs:
+        proc.wait()
+
+    merged = {}
+    for output in outputs:
+        with open(output, encoding="utf-8") as f:
+            for label, r in json.load(f)["workloads"][args.workload].items():
+                if not isinstance(r, dict):
+                    continue
+                m = merged.setdefault(label, {"requests": 0, "errors": 0, "rps": 0.0, "p50_ms": 0.0, "p99_ms": 0.0})
+                m["requests"] += r["requests"]
+                m["errors"] += r["errors"]
+                m["rps"] = round(m["rps"] + r["rps"], 1)
+                m["p50_ms"] = max(m["p50_ms"], r["p50_ms"])
+                m["p99_ms"] = max(m["p99_ms"], r["p99_ms"])
+    return merged
+
+
+def bench(args, workers, stub_url, workdir):
+    port = free_port()
+    env = dict(
+        os.environ,
+        WEB_CONCURRENCY=str(workers),
+        PORT=str(port),
+        OPENWEATHERMAP_BASE_URL=stub_url,
+        OPENWEATHERMAP_API_KEY=os.getenv("OPENWEATHERMAP_API_KEY", "loadtest"),
+        PROMETHEUS_MULTIPROC_DIR=os.path.join(workdir, f"prom-{workers}"),
+    )
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "--log-level", "warning", "main:app"],
+        cwd=BACKEND_DIR, env=env,
+    )
+    try:
+        url = f"http://127.0.0.1:{port}"
+        wait_until_up(f"{url}/metrics")
+        return run_clients(args, url, workdir)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare backend throughput with different worker counts")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, os.cpu_count() or 2])
+    parser.add_argument("--workload", choices=["hot", "cold", "history"], default="hot")
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=50, help="Concurrency per client process")
+    parser.add_argument("--clients", type=int, default=4, help="Number of load generator processes")
+    parser.add_argument("--cities", type=int, default=200)
+    parser.add_argument("--stub-latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    stub_port = free_port()
+    stub = subprocess.Popen(
+        [sys.executable, os.path.join(BACKEND_DIR, "benchmarks", "stub_provider.py")],
+        env=dict(os.environ, STUB_PORT=str(stub_port), STUB_LATENCY=str(args.stub_latency)),
+        stderr=subprocess.DEVNULL,
+    )
+    results = {}
+    try:
+        stub_url = f"http://127.0.0.1:{stub_port}"
+        wait_until_up(stub_url)
+        with tempfile.TemporaryDirectory() as workdir:
+            for workers in args.workers:
+                results[workers] = bench(args, workers, stub_url, workdir)
+    finally:
+        stub.terminate()
+        stub.wait()
+
+    base = results[args.workers[0]]
+    print(f"\n== {args.workload}: {args.requests} requests, {args.clients}x{args.concurrency} concurrent ==")
+    for workers, merged in results.items():
+        for label, r in merged.items():
+            speedup = r["rps"] / base[label]["rps"] if base.get(label, {}).get("rps") else 0
+            print(f"workers={workers:<3} {label:<18} {r['rps']:>9.1f} req/s  x{speedup:.2f}  "
+                  f"p50={r['p50_ms']:>8.2f}ms p99={r['p99_ms']:>8.2f}ms err={r['errors']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+# Нагрузочный тест бэкенда с локальной заглушкой OpenWeatherMap.
+#
+# Сценарии (--workload):
+#   hot     — запросы к --cities городам с перекосом по Zipf (популярные города чаще)
+#   cold    — каждый запрос к новому городу, все промахи кэша
+#   expiry  — прогрев городов, одновременное удаление ключей и шторм запросов к ним
+#   history — чтение /weather_history?limit=100 вперемешку с прогнозами
+#   all     — все сценарии по очереди
+#
+# По умолчанию приложение запускается в процессе (httpx.ASGITransport), провайдер —
+# заглушка benchmarks/stub_provider.py. Redis — по REDIS_HOST/REDIS_PORT или
+# встроенный fakeredis (--fake-redis, нужен пакет fakeredis). С --url нагрузка
+# идёт на уже запущенный сервер (его OPENWEATHERMAP_BASE_URL должен указывать на заглушку).
+#
+# Результат (req/s и p50/p95/p99 по эндпоинтам) печатается и сохраняется в JSON;
+# --compare сравнивает с предыдущим файлом.
+#
+#   cd backend && python benchmarks/loadtest.py --fake-redis --workload all
+#   python benchmarks/loadtest.py --fake-redis --workload hot --compare benchmarks/results/hot-<commit>.json
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import httpx  # noqa: E402
+
+from benchmarks import stub_provider  # noqa: E402
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+WORKLOADS = ["hot", "cold", "expiry", "history"]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_fake_redis():
+    try:
+        from fakeredis import TcpFakeServer
+    except ImportError:
+        sys.exit("--fake-redis needs the fakeredis package: pip install fakeredis")
+    port = free_port()
+    server = TcpFakeServer(("127.0.0.1", port), server_type="redis")
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return port
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def zipf_cities(prefix, count, requests, skew):
+    cities = [f"{prefix}{i}" for i in range(count)]
+    weights = [1 / (rank + 1) ** skew for rank in range(count)]
+    return random.choices(cities, weights=weights, k=requests)
+
+
+class LoadRunner:
+    def __init__(self, client, concurrency):
+        self.client = client
+        self.concurrency = concurrency
+
+    async def run(self, requests):
+        # requests — список (метка эндпоинта, путь)
+        samples = {}
+        queue = asyncio.Queue()
+        for item in requests:
+            queue.put_nowait(item)
+
+        async def worker():
+            while not queue.empty():
+                label, path = queue.get_nowait()
+                started = time.perf_counter()
+                try:
+                    response = await self.client.get(path)
+                    ok = response.status_code < 500
+                except httpx.HTTPError:
+                    ok = False
+                latency = time.perf_counter() - started
+                bucket = samples.setdefault(label, {"latencies": [], "errors": 0})
+                bucket["latencies"].append(latency)
+                bucket["errors"] += not ok
+
+        started = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(self.concurrency)])
+        elapsed = time.perf_counter() - started
+        return summarize(samples, elapsed)
+
+
+def summarize(samples, elapsed):
+    results = {}
+    for label, bucket in samples.items():
+        latencies = bucket["latencies"]
+        results[label] = {
+            "requests": len(latencies),
+            "errors": bucket["errors"],
+            "rps": round(len(latencies) / elapsed, 1),
+            "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+            "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+            "max_ms": round(max(latencies) * 1000, 2),
+        }
+    return results
+
+
+async def purge_cache(redis_client, app_module):
+    keys = [key async for key in redis_client.scan_iter("provider:*")]
+    if keys:
+        await redis_client.delete(*keys)
+    if app_module is not None:
+        app_module.local_cache.clear()
+
+
+async def run_workload(name, runner, args, redis_client, app_module):
+    run_id = int(time.time() * 1000)
+    n = args.requests
+    if name == "hot":
+        plan = [("/forecast/{city}", f"/forecast/{city}") for city in zipf_cities("Hot", args.cities, n, args.skew)]
+        await runner.run(plan[: args.cities])  # прогрев
+        return await runner.run(plan)
+    if name == "cold":
+        return await runner.run([("/forecast/{city}", f"/forecast/Cold{run_id}-{i}") for i in range(n)])
+    if name == "expiry":
+        cities = [f"Storm{run_id}-{i}" for i in range(args.cities)]
+        await runner.run([("/forecast/{city}", f"/forecast/{city}") for city in cities])
+        await purge_cache(redis_client, app_module)
+        plan = [("/forecast/{city}", f"/forecast/{random.choice(cities)}") for _ in range(n)]
+        return await runner.run(plan)
+    if name == "history":
+        plan = []
+        for city in zipf_cities("Hist", args.cities, n, args.skew):
+            if random.random() < 0.1:
+                plan.append(("/forecast/{city}", f"/forecast/{city}"))
+            else:
+                plan.append(("/weather_history", "/weather_history?limit=100"))
+        return await runner.run(plan)
+    raise ValueError(f"Unknown workload {name}")
+
+
+def print_results(name, results, baseline=None):
+    print(f"\n== {name} ==")
+    for label, r in results.items():
+        line = (f"{label:<18} n={r['requests']:<6} err={r['errors']:<4} {r['rps']:>9.1f} req/s "
+                f"p50={r['p50_ms']:>8.2f}ms p95={r['p95_ms']:>8.2f}ms p99={r['p99_ms']:>8.2f}ms")
+        old = (baseline or {}).get(label)
+        if old:
+            line += (f"  | rps {delta(old['rps'], r['rps'])} p50 {delta(old['p50_ms'], r['p50_ms'])}"
+                     f" p99 {delta(old['p99_ms'], r['p99_ms'])}")
+        print(line)
+
+
+def delta(old, new):
+    if not old:
+        return "n/a"
+    return f"{(new - old) / old * 100:+.1f}%"
+
+
+async def main(args):
+    import redis.asyncio as aioredis
+
+    if args.fake_redis:
+        os.environ["REDIS_HOST"], os.environ["REDIS_PORT"] = "127.0.0.1", str(start_fake_redis())
+    redis_client = aioredis.Redis(
+        host=os.getenv("REDIS_HOST", "localhost"), port=int(os.getenv("REDIS_PORT", "6379")), decode_responses=True
+    )
+
+    app_module = None
+    stub = None
+    if args.url:
+        transport = None
+        base_url = args.url
+    else:
+        stub_port = free_port()
+        stub, _ = stub_provider.run_in_thread(stub_port, args.stub_latency, args.stub_jitter, args.stub_error_rate)
+        os.environ.setdefault("OPENWEATHERMAP_API_KEY", "loadtest")
+        os.environ["OPENWEATHERMAP_BASE_URL"] = f"http://127.0.0.1:{stub_port}"
+        import main as app_module
+
+        transport = httpx.ASGITransport(app=app_module.app)
+        base_url = "http://loadtest"
+
+    logging.getLogger().setLevel(args.log_level)
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with contextlib.AsyncExitStack() as stack:
+        if app_module is not None:
+            # startup/shutdown приложения: подключения к Redis и провайдеру, фоновые задачи
+            await stack.enter_async_context(app_module.app.router.lifespan_context(app_module.app))
+        client = await stack.enter_async_context(
+            httpx.AsyncClient(transport=transport, base_url=base_url, limits=limits, timeout=60)
+        )
+        runner = LoadRunner(client, args.concurrency)
+        workloads = WORKLOADS if args.workload == "all" else [args.workload]
+        report = {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "config": {k: v for k, v in vars(args).items() if k not in ("compare", "output")},
+            "workloads": {},
+        }
+        baseline = {}
+        if args.compare:
+            with open(args.compare, encoding="utf-8") as f:
+                baseline = json.load(f).get("workloads", {})
+        for name in workloads:
+            calls_before = stub.state.calls if stub is not None else 0
+            results = await run_workload(name, runner, args, redis_client, app_module)
+            if stub is not None:
+                results["provider_calls"] = stub.state.calls - calls_before
+            report["workloads"][name] = results
+            print_results(name, {k: v for k, v in results.items() if isinstance(v, dict)}, baseline.get(name))
+
+    await redis_client.aclose()
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{args.workload}-{report['commit']}-{int(time.time())}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nSaved results to {output}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Weather backend load test")
+    parser.add_argument("--workload", choices=WORKLOADS + ["all"], default="hot")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--cities", type=int, default=200)
+    parser.add_argument("--skew", type=float, default=1.1, help="Zipf exponent for city popularity")
+    parser.add_argument("--url", help="Load an already running server instead of the in-process app")
+    parser.add_argument("--fake-redis", action="store_true", help="Start an in-process fakeredis server")
+    parser.add_argument("--stub-latency", type=float, default=stub_provider.STUB_LATENCY)
+    parser.add_argument("--stub-jitter", type=float, default=stub_provider.STUB_JITTER)
+    parser.add_argument("--stub-error-rate", type=float, default=stub_provider.STUB_ERROR_RATE)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--log-level", default="WARNING", help="Log level of the in-process app")
+    parser.add_argument("--output", help="Result JSON path (default: benchmarks/results/<workload>-<commit>-<ts>.json)")
+    parser.add_argument("--compare", help="Previous result JSON to diff against")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    arguments = parse_args()
+    random.seed(arguments.seed)
+    asyncio.run(main(arguments))
@@ -0,0 +1,78 @@
+# Локальная заглушка OpenWeatherMap для бенчмарков: отдаёт синтетический
+# 5-дневный прогноз (40 записей по 3 часа) с настраиваемой задержкой и долей ошибок.
+# Города с префиксом "Unknown" (без учёта регистра) отвечают 404. Поддерживается запрос по id=, в том числе
+# по id, выданному этой заглушкой при поиске по названию.
+import asyncio
+import os
+import random
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta
+
+import uvicorn
+from fastapi import FastAPI, HTTPException, Query
+
+STUB_LATENCY = float(os.getenv("STUB_LATENCY", "0.2"))
+STUB_JITTER = float(os.getenv("STUB_JITTER", "0"))
+STUB_ERROR_RATE = float(os.getenv("STUB_ERROR_RATE", "0"))
+
+DESCRIPTIONS = [("clear sky", "01d"), ("few clouds", "02d"), ("light rain", "10d"), ("overcast clouds", "04d")]
+
+
+def make_forecast_payload(city, items=40, start=None):
+    start = start or datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+    start -= timedelta(hours=start.hour % 3)
+    seed = sum(map(ord, city))
+    forecast = []
+    for i in range(items):
+        moment = start + timedelta(hours=3 * i)
+        description, icon = DESCRIPTIONS[(seed + i) % len(DESCRIPTIONS)]
+        forecast.append({
+            "dt": int((moment - datetime(1970, 1, 1)).total_seconds()),
+            "dt_txt": moment.strftime("%Y-%m-%d %H:%M:%S"),
+            "main": {"temp": round(((seed + i * 7) % 400) / 10 - 10, 2)},
+            "weather": [{"description": description, "icon": icon}],
+        })
+    return {"list": forecast, "city": {"id": city_id(city), "name": city, "country": "XX"}}
+
+
+def city_id(city):
+    return zlib.crc32(city.encode()) % 10_000_000
+
+
+def create_app(latency=STUB_LATENCY, jitter=STUB_JITTER, error_rate=STUB_ERROR_RATE):
+    app = FastAPI()
+    app.state.calls = 0
+    names = {}
+
+    @app.get("/data/2.5/forecast")
+    async def forecast(q: str = Query(None), id: int = Query(None), lang: str = "en"):
+        app.state.calls += 1
+        await asyncio.sleep(max(0.0, latency + random.uniform(-jitter, jitter)))
+        if q is None:
+            if id is None:
+                raise HTTPException(status_code=400, detail="q or id is required")
+            q = names.get(id, f"City{id}")
+        names[city_id(q)] = q
+        if q.lower().startswith("unknown"):
+            raise HTTPException(status_code=404, detail="city not found")
+        if error_rate and random.random() < error_rate:
+            raise HTTPException(status_code=500, detail="stub provider error")
+        return make_forecast_payload(q)
+
+    return app
+
+
+def run_in_thread(port, latency=STUB_LATENCY, jitter=STUB_JITTER, error_rate=STUB_ERROR_RATE):
+    app = create_app(latency, jitter, error_rate)
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    return app, server
+
+
+if __name__ == "__main__":
+    uvicorn.run(create_app(), host="0.0.0.0", port=int(os.getenv("STUB_PORT", "9001")))
@@ -0,0 +1,75 @@
+import ast
+import logging
+
+from forecast_model import ForecastSeries
+
+try:
+    import orjson
+except ImportError:  # orjson не установлен — работаем на стандартном json
+    orjson = None
+    import json
+
+logger = logging.getLogger(__name__)
+
+# Версия формата хранится префиксом значения; записи без префикса — старый формат str(dict)
+FORMAT_PREFIX = "v1:"
+
+
+class CodecError(ValueError):
+    pass
+
+
+def _dumps(value):
+    if orjson is not None:
+        return orjson.dumps(value).decode("utf-8")
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+def _loads(raw):
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+def encode(value):
+    return FORMAT_PREFIX + _dumps(value)
+
+
+def decode(raw):
+    if raw.startswith(FORMAT_PREFIX):
+        try:
+            return _loads(raw[len(FORMAT_PREFIX):])
+        except ValueError as e:
+            raise CodecError(f"Invalid {FORMAT_PREFIX} payload: {e}") from e
+    # Миграция: записи, сохранённые до перехода на JSON
+    try:
+        return ast.literal_eval(raw)
+    except (ValueError, SyntaxError) as e:
+        raise CodecError(f"Invalid legacy payload: {e}") from e
+
+
+# Прогноз провайдера хранится в колоночном формате v2 (см. forecast_model); записи v1
+# и старого формата со списком словарей "list" переводятся в колонки при чтении
+FORECAST_PREFIX = "v2:"
+
+
+def encode_forecast(payload):
+    value = {key: item for key, item in payload.items() if key != "series"}
+    value["series"] = payload["series"].to_columns()
+    return FORECAST_PREFIX + _dumps(value)
+
+
+def decode_forecast(raw):
+    if raw.startswith(FORECAST_PREFIX):
+        try:
+            value = _loads(raw[len(FORECAST_PREFIX):])
+            value["series"] = ForecastSeries.from_columns(value["series"])
+        except (ValueError, KeyError, TypeError, IndexError) as e:
+            raise CodecError(f"Invalid {FORECAST_PREFIX} payload: {e}") from e
+        return value
+    value = decode(raw)
+    try:
+        value["series"] = ForecastSeries.from_items(value.pop("list"))
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+        raise CodecError(f"Invalid forecast payload: {e}") from e
+    return value
@@ -0,0 +1,95 @@
+# Компактное представление прогноза провайдера (40 записей по 3 часа) в памяти и в кэше.
+#
+# Вместо списка словарей {"dt", "dt_txt", "temp", "description", "icon"} — колонки:
+# время в секундах epoch (array 'q'), температуры (array 'd'), описания и иконки —
+# кортежи интернированных строк, общих для всех городов в процессе. dt_txt не хранится,
+# строка даты строится из dt только для отдаваемых записей.
+#
+# В Redis колонки пишутся так (формат v2 в codec.encode_forecast):
+#   {"dt0": <первый dt>, "step": 10800, "temp": [...], "strings": [...], "description": [индексы], "icon": [индексы]}
+# Для нерегулярного шага вместо dt0/step — полный список "dt".
+import calendar
+import sys
+import time
+from array import array
+from functools import lru_cache
+
+
+# Моменты прогноза общие для всех городов (шаг 3 часа), поэтому строки дат кэшируются
+@lru_cache(maxsize=1024)
+def format_dt(dt):
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(dt))
+
+
+def parse_dt_txt(dt_txt):
+    return calendar.timegm(time.strptime(dt_txt, "%Y-%m-%d %H:%M:%S"))
+
+
+class ForecastSeries:
+    __slots__ = ("dt", "temp", "description", "icon")
+
+    def __init__(self, dt, temp, description, icon):
+        self.dt = array("q", dt)
+        self.temp = array("d", temp)
+        self.description = tuple(sys.intern(d) for d in description)
+        self.icon = tuple(sys.intern(i) for i in icon)
+
+    @classmethod
+    def from_items(cls, items):
+        # Записи старого формата (список словарей); без числового dt время берётся из dt_txt
+        return cls(
+            [item["dt"] if item.get("dt") is not None else parse_dt_txt(item["dt_txt"]) for item in items],
+            [item["temp"] for item in items],
+            [item["description"] for item in items],
+            [item["icon"] for item in items],
+        )
+
+    @classmethod
+    def from_columns(cls, columns):
+        strings = columns["strings"]
+        if "dt" in columns:
+            dt = columns["dt"]
+        else:
+            dt = range(columns["dt0"], columns["dt0"] + columns["step"] * len(columns["temp"]), columns["step"])
+        return cls(
+            dt,
+            columns["temp"],
+            [strings[i] for i in columns["description"]],
+            [strings[i] for i in columns["icon"]],
+        )
+
+    def to_columns(self):
+        strings = {}
+        description = [strings.setdefault(d, len(strings)) for d in self.description]
+        icon = [strings.setdefault(i, len(strings)) for i in self.icon]
+        columns = {}
+        step = self.dt[1] - self.dt[0] if len(self.dt) > 1 else 0
+        if step > 0 and all(self.dt[i] - self.dt[i - 1] == step for i in range(2, len(self.dt))):
+            columns["dt0"], columns["step"] = self.dt[0], step
+        else:
+            columns["dt"] = self.dt.tolist()
+        columns.update(temp=self.temp.tolist(), strings=list(strings), description=description, icon=icon)
+        return columns
+
+    def __len__(self):
+        return len(self.dt)
+
+    def __eq__(self, other):
+        if not isinstance(other, ForecastSeries):
+            return NotImplemented
+        return (self.dt, self.temp, self.description, self.icon) == (other.dt, other.temp, other.description, other.icon)
+
+
+COMPACT_FIELDS = ("dt", "temperature", "temp_min", "temp_max", "temp_avg")
+COMPACT_STRING_FIELDS = ("description", "dominant_description", "icon")
+
+
+def compact_forecast(forecast_list):
+    # Ответ ?format=compact: дневные записи колонками, время — epoch (dt),
+    # строковые поля — индексы в общем списке strings
+    strings = {}
+    columns = {field: [day[field] for day in forecast_list] for field in COMPACT_FIELDS}
+    for field in COMPACT_STRING_FIELDS:
+        columns[field] = [strings.setdefault(day[field], len(strings)) for day in forecast_list]
+    columns["strings"] = list(strings)
+    return columns
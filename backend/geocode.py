@@ -0,0 +1,87 @@
+import bisect
+import gzip
+import json
+import logging
+import unicodedata
+
+logger = logging.getLogger(__name__)
+
+# Hash Redis: нормализованный запрос -> id города у провайдера, общий для всех реплик
+CITY_ALIAS_KEY = "city_alias"
+
+
+def normalize_name(name):
+    # "  São-Paulo " -> "sao paulo", "Ёлки" -> "елки": регистр, пробелы, дефисы и диакритика не различаются
+    decomposed = unicodedata.normalize("NFKD", name.replace("-", " "))
+    stripped = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return " ".join(stripped.split()).casefold()
+
+
+class CityIndex:
+    # Справочник городов в памяти: точное разрешение названия (и синонимов) в id провайдера
+    # и поиск по префиксу для автодополнения. Формат файла — список объектов как в
+    # city.list.json OpenWeatherMap ({"id", "name", "country", ...}) с необязательными
+    # полями "aliases" и "population". При совпадении названий выигрывает более крупный
+    # город, затем — раньше загруженный.
+
+    def __init__(self, max_learned=10000):
+        self.cities = {}
+        self._aliases = {}
+        self._rank = {}
+        self._sorted = []
+        self._learned = {}
+        self.max_learned = max_learned
+
+    def __len__(self):
+        return len(self.cities)
+
+    def load(self, path):
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt", encoding="utf-8") as f:
+            self.add_entries(json.load(f))
+
+    def add_entries(self, entries):
+        added = []
+        for entry in sorted(entries, key=lambda e: -(e.get("population") or 0)):
+            city_id = int(entry["id"])
+            if city_id in self.cities:
+                continue
+            self.cities[city_id] = {"id": city_id, "name": entry["name"], "country": entry.get("country", "")}
+            self._rank[city_id] = len(self._rank)
+            for alias in {normalize_name(a) for a in [entry["name"], *entry.get("aliases", [])]}:
+                if alias:
+                    self._aliases.setdefault(alias, []).append(city_id)
+                    added.append((alias, city_id))
+        self._sorted = sorted(self._sorted + added)
+
+    def resolve(self, query):
+        # Возвращает id города или None; "London,CA" уточняет страну
+        name, _, country = query.partition(",")
+        ids = self._aliases.get(normalize_name(name))
+        if ids:
+            country = country.strip().upper()
+            if not country:
+                return ids[0]
+            for city_id in ids:
+                if self.cities[city_id]["country"] == country:
+                    return city_id
+        return self._learned.get(normalize_name(query))
+
+    def remember(self, alias, city_id):
+        # Соответствие, найденное через провайдера или Redis, для городов вне справочника
+        if alias in self._learned or len(self._learned) < self.max_learned:
+            self._learned[alias] = int(city_id)
+
+    def autocomplete(self, prefix, limit=10, scan_limit=1000):
+        key = normalize_name(prefix)
+        if not key:
+            return []
+        candidates = {}
+        start = bisect.bisect_left(self._sorted, (key,))
+        for alias, city_id in self._sorted[start:start + scan_limit]:
+            if not alias.startswith(key):
+                break
+            candidates.setdefault(city_id, alias == key)
+        # Сначала точные совпадения, затем крупные города
+        ordered = sorted(candidates, key=lambda city_id: (not candidates[city_id], self._rank[city_id]))
+        return [self.cities[city_id] for city_id in ordered[:limit]]
@@ -0,0 +1,33 @@
+# Запуск в несколько процессов: gunicorn управляет воркерами uvicorn.
+#   gunicorn -c gunicorn.conf.py main:app
+# Каждый воркер сам открывает соединения с Redis и OpenWeatherMap в lifespan,
+# поэтому preload_app не используется и у воркеров нет общего состояния.
+import multiprocessing
+import os
+import shutil
+
+# Метрики воркеров пишутся в файлы и собираются вместе на /metrics любого воркера.
+# Переменная должна быть задана до импорта prometheus_client в воркерах.
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/prometheus_multiproc")
+
+from prometheus_client import multiprocess  # noqa: E402
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", str(min(4, multiprocessing.cpu_count()))))
+worker_class = "uvicorn.workers.UvicornWorker"
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+accesslog = "-" if os.getenv("GUNICORN_ACCESS_LOG", "false").lower() in ("1", "true", "yes") else None
+
+
+def on_starting(server):
+    # Файлы метрик от прошлого запуска дали бы неверные суммы
+    multiproc_dir = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    shutil.rmtree(multiproc_dir, ignore_errors=True)
+    os.makedirs(multiproc_dir, exist_ok=True)
+
+
+def child_exit(server, worker):
+    # live*-гейджи умершего воркера больше не учитываются
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,75 @@
+import time
+from datetime import datetime, timezone
+
+# История запросов: поток с записями (id записи — время запроса, хранение ограничено по времени
+# через MINID) и почасовые агрегаты — zset с числом запросов по городам и hash с суммой
+# температур. "Топ городов за час" — один ZREVRANGE, без разбора самих записей.
+HISTORY_STREAM_KEY = "weather_history:stream"
+# Список последних 100 записей в JSON — формат до появления потока, читается как запасной вариант
+LEGACY_HISTORY_KEY = "weather_history"
+TOP_KEY_PREFIX = "weather_history:top:"
+STATS_KEY_PREFIX = "weather_history:stats:"
+
+ENTRY_FIELDS = ("city", "forecast_date", "avg_temperature", "description", "icon")
+
+
+def hour_bucket(timestamp):
+    return time.strftime("%Y%m%d%H", time.gmtime(timestamp))
+
+
+def add_entries(pipe, entries, now, retention, bucket_ttl):
+    # Команды добавляются в переданный pipeline, чтобы попасть в общий MULTI/EXEC запроса
+    bucket = hour_bucket(now)
+    top_key, stats_key = TOP_KEY_PREFIX + bucket, STATS_KEY_PREFIX + bucket
+    min_id = int((now - retention) * 1000)
+    for entry in entries:
+        city = entry["city"]
+        pipe.xadd(HISTORY_STREAM_KEY, {field: entry[field] for field in ENTRY_FIELDS}, minid=min_id, approximate=True)
+        pipe.zincrby(top_key, 1, city)
+        pipe.hincrby(stats_key, f"{city}|n", 1)
+        pipe.hincrbyfloat(stats_key, f"{city}|t", entry["avg_temperature"])
+    pipe.expire(top_key, bucket_ttl)
+    pipe.expire(stats_key, bucket_ttl)
+
+
+def parse_entry(entry_id, fields):
+    # Время запроса хранится в id записи потока ("<ms>-<seq>")
+    ms = int(entry_id.split("-", 1)[0])
+    return {
+        "city": fields.get("city"),
+        "forecast_date": fields.get("forecast_date"),
+        "avg_temperature": float(fields.get("avg_temperature", 0)),
+        "description": fields.get("description"),
+        "icon": fields.get("icon"),
+        "request_time": datetime.fromtimestamp(ms / 1000, timezone.utc).replace(tzinfo=None).isoformat(timespec="milliseconds") + "Z",
+    }
+
+
+async def top_cities(redis_client, hours, limit, now):
+    # За один час — ZREVRANGE по готовому zset (O(log n + limit));
+    # за несколько часов — объединение почасовых zset
+    buckets = [hour_bucket(now - 3600 * i) for i in range(hours)]
+    if hours == 1:
+        ranked = await redis_client.zrevrange(TOP_KEY_PREFIX + buckets[0], 0, limit - 1, withscores=True)
+    else:
+        union = await redis_client.zunion([TOP_KEY_PREFIX + b for b in buckets], withscores=True)
+        ranked = sorted(union, key=lambda item: -item[1])[:limit]
+    if not ranked:
+        return []
+
+    fields = [f"{city}|{suffix}" for city, _ in ranked for suffix in ("n", "t")]
+    async with redis_client.pipeline(transaction=False) as pipe:
+        for bucket in buckets:
+            pipe.hmget(STATS_KEY_PREFIX + bucket, fields)
+        stats = await pipe.execute()
+
+    result = []
+    for i, (city, requests) in enumerate(ranked):
+        count = sum(int(values[2 * i] or 0) for values in stats)
+        temp_sum = sum(float(values[2 * i + 1] or 0) for values in stats)
+        result.append({
+            "city": city,
+            "requests": int(requests),
+            "avg_temperature": round(temp_sum / count, 2) if count else None,
+        })
+    return result
@@ -0,0 +1,74 @@
+import hashlib
+from email.utils import formatdate, parsedate_to_datetime
+
+from fastapi import Response
+
+
+def make_etag(*parts):
+    # Слабый ETag: тело может отличаться сжатием и флагами fromCache/stale, данные — те же
+    digest = hashlib.blake2b("|".join(str(p) for p in parts).encode(), digest_size=12).hexdigest()
+    return f'W/"{digest}"'
+
+
+def http_date(timestamp):
+    return formatdate(timestamp, usegmt=True)
+
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match or not etag:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Сравнение слабое: W/"x" и "x" считаются одним тегом
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if (candidate[2:] if candidate.startswith("W/") else candidate) == opaque:
+            return True
+    return False
+
+
+def not_modified_since(if_modified_since, last_modified):
+    if not if_modified_since or last_modified is None:
+        return False
+    try:
+        return int(last_modified) <= parsedate_to_datetime(if_modified_since).timestamp()
+    except (TypeError, ValueError):
+        return False
+
+
+def apply_cache_headers(request, response, etag=None, last_modified=None, cache_control=None):
+    # Проставляет заголовки кэширования; возвращает готовый ответ 304, если копия клиента актуальна
+    headers = {}
+    if etag:
+        headers["ETag"] = etag
+    if last_modified is not None:
+        headers["Last-Modified"] = http_date(last_modified)
+    if cache_control:
+        headers["Cache-Control"] = cache_control
+    response.headers.update(headers)
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # If-Modified-Since учитывается, только если клиент не прислал If-None-Match
+        fresh = etag_matches(if_none_match, etag)
+    else:
+        fresh = not_modified_since(request.headers.get("if-modified-since"), last_modified)
+    if fresh:
+        return Response(status_code=304, headers=headers)
+    return None
+
+
+class ExcludePaths:
+    # Запросы к путям из paths идут мимо обёрнутого middleware — например, потоки SSE мимо сжатия,
+    # которое буферизует ответ целиком
+    def __init__(self, app, middleware, paths, **options):
+        self.app = app
+        self.wrapped = middleware(app, **options)
+        self.paths = tuple(paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"].startswith(self.paths):
+            await self.app(scope, receive, send)
+        else:
+            await self.wrapped(scope, receive, send)
@@ -0,0 +1,57 @@
+import time
+from collections import OrderedDict
+
+
+class LocalCache:
+    # Ограниченный по числу записей и объёму LRU-кэш с TTL внутри процесса.
+    # Хранит уже разобранные значения, поэтому попадание не требует десериализации.
+
+    def __init__(self, max_items=500, max_bytes=16 * 1024 * 1024, on_evict=None, clock=time.monotonic):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.on_evict = on_evict
+        self.clock = clock
+        self.total_bytes = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, size, expires_at = entry
+        if expires_at <= self.clock():
+            self._remove(key, "expired")
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key, value, size, ttl):
+        if self.max_items <= 0 or ttl <= 0 or size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key, None)
+        self._entries[key] = (value, size, self.clock() + ttl)
+        self.total_bytes += size
+        while len(self._entries) > self.max_items or self.total_bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest, "size")
+
+    def invalidate(self, key):
+        if key in self._entries:
+            self._remove(key, "invalidated")
+
+    def clear(self):
+        self._entries.clear()
+        self.total_bytes = 0
+
+    def _remove(self, key, reason):
+        _, size, _ = self._entries.pop(key)
+        self.total_bytes -= size
+        if reason and self.on_evict:
+            self.on_evict(reason)
@@ -1,23 +1,52 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-import requests
+from fastapi.middleware.gzip import GZipMiddleware
+import asyncio
+import json
 import os
+from contextlib import asynccontextmanager
 import redis
+import redis.asyncio as aioredis
 from dotenv import load_dotenv
 import time
 import logging
-from collections import Counter
-from statistics import mean
 from datetime import datetime
 from prometheus_fastapi_instrumentator import Instrumentator
 from prometheus_client import Counter as PrometheusCounter
+from provider import ProviderClient, ProviderError, CityNotFoundError, ProviderUnavailableError
+from resilience import RateLimiter, CircuitBreaker
+from singleflight import SingleFlight, RedisLock
+from local_cache import LocalCache
+from aggregation import aggregate_daily
+from forecast_model import ForecastSeries, compact_forecast
+from refresh import RefreshAheadScheduler, record_popularity, top_popular
+from warmup import CacheWarmer
+import codec
+from codec import CodecError
+from metrics import stage
+from http_cache import apply_cache_headers, make_etag, ExcludePaths
+from geocode import CityIndex, CITY_ALIAS_KEY, normalize_name
+import history
+from updates import UpdateHub, updates_channel
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 load_dotenv()
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app):
+    # Подключения создаются при старте каждого воркера (после fork), а не при импорте модуля
+    await startup()
+    try:
+        yield
+    finally:
+        await shutdown()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # Настройка CORS
 app.add_middleware(
@@ -28,6 +57,21 @@ app.add_middleware(
     allow_headers=["*"],  # Разрешаем все заголовки
 )
 
+# Сжатие ответов больше HTTP_COMPRESS_MIN_SIZE байт: brotli, если установлен brotli-asgi, иначе gzip.
+# Поток /forecast/stream не сжимается: события должны уходить клиенту сразу
+HTTP_COMPRESS_MIN_SIZE = int(os.getenv("HTTP_COMPRESS_MIN_SIZE", "1000"))
+HTTP_COMPRESS_EXCLUDE = ("/forecast/stream",)
+try:
+    from brotli_asgi import BrotliMiddleware
+    app.add_middleware(
+        ExcludePaths, middleware=BrotliMiddleware, paths=HTTP_COMPRESS_EXCLUDE,
+        minimum_size=HTTP_COMPRESS_MIN_SIZE, gzip_fallback=True,
+    )
+except ImportError:
+    app.add_middleware(
+        ExcludePaths, middleware=GZipMiddleware, paths=HTTP_COMPRESS_EXCLUDE, minimum_size=HTTP_COMPRESS_MIN_SIZE
+    )
+
 Instrumentator().instrument(app).expose(app)
 redis_cache_hits = PrometheusCounter(
     name='redis_cache_hits_total',
@@ -41,6 +85,19 @@ openweather_requests = PrometheusCounter(
     name='openweather_requests_total',
     documentation='Total number of requests to OpenWeatherMap'
 )
+local_cache_hits = PrometheusCounter(
+    name='local_cache_hits_total',
+    documentation='Total number of in-process cache hits'
+)
+local_cache_misses = PrometheusCounter(
+    name='local_cache_misses_total',
+    documentation='Total number of in-process cache misses'
+)
+local_cache_evictions = PrometheusCounter(
+    name='local_cache_evictions_total',
+    documentation='Total number of in-process cache evictions',
+    labelnames=['reason']
+)
 
 OPENWEATHERMAP_API_KEY = os.getenv("OPENWEATHERMAP_API_KEY")
 REDIS_HOST = os.getenv("REDIS_HOST")
@@ -48,168 +105,853 @@ REDIS_PORT = os.getenv("REDIS_PORT")
 
 logger.info(f"Environment variables: REDIS_HOST={REDIS_HOST}, REDIS_PORT={REDIS_PORT}")
 
-if not OPENWEATHERMAP_API_KEY:
-    logger.error("OPENWEATHERMAP_API_KEY environment variable is not set")
-    raise ValueError("OPENWEATHERMAP_API_KEY environment variable is not set")
+# Мягкий TTL: после него запись отдаётся как устаревшая (stale) и обновляется в фоне.
+# Жёсткий TTL: срок жизни ключа в Redis, после него запрос ждёт провайдера.
+CACHE_SOFT_TTL = int(os.getenv("CACHE_SOFT_TTL", "3600"))
+CACHE_HARD_TTL = int(os.getenv("CACHE_HARD_TTL", "7200"))
+# HTTP-кэширование: max-age прогноза — остаток мягкого TTL, но не больше HTTP_CACHE_MAX_AGE;
+# истории — HTTP_HISTORY_MAX_AGE (она меняется с каждым запросом прогноза)
+HTTP_CACHE_MAX_AGE = int(os.getenv("HTTP_CACHE_MAX_AGE", "600"))
+HTTP_STALE_WHILE_REVALIDATE = int(os.getenv("HTTP_STALE_WHILE_REVALIDATE", "60"))
+HTTP_HISTORY_MAX_AGE = int(os.getenv("HTTP_HISTORY_MAX_AGE", "5"))
+# Если провайдер недоступен, устаревшая запись продлевается на столько секунд и продолжает отдаваться
+CACHE_STALE_EXTEND = int(os.getenv("CACHE_STALE_EXTEND", "1800"))
 
-try:
-    redis_client = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
-    redis_client.ping()
-    logger.info(f"Successfully connected to Redis at {REDIS_HOST}:{REDIS_PORT}")
-except redis.exceptions.ConnectionError as e:
-    logger.error(f"Failed to connect to Redis at {REDIS_HOST}:{REDIS_PORT} - {e}")
-    raise RuntimeError(f"Failed to connect to Redis: {e}")
+# Общий для всех реплик лимит запросов к OpenWeatherMap (запросов в секунду, 0 — выключен),
+# допустимый всплеск и дневной бюджет вызовов (0 — без ограничения)
+OPENWEATHER_RATE_LIMIT = float(os.getenv("OPENWEATHER_RATE_LIMIT", "0"))
+OPENWEATHER_BURST = int(os.getenv("OPENWEATHER_BURST", "10"))
+OPENWEATHER_DAILY_QUOTA = int(os.getenv("OPENWEATHER_DAILY_QUOTA", "0"))
+OPENWEATHER_RATE_LIMIT_WAIT = float(os.getenv("OPENWEATHER_RATE_LIMIT_WAIT", "2"))
+# Circuit breaker: после стольких неудачных запросов подряд провайдер не вызывается RESET секунд
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_TIMEOUT = float(os.getenv("CIRCUIT_RESET_TIMEOUT", "30"))
 
-@app.get("/forecast/{city}")
-async def get_forecast(city: str, lang: str = "en", days: int = None):
-    logger.info(f"Received request: city={city}, lang={lang}, days={days}")
-    cache_key = f"forecast:{city}:{lang}:{days or 'current'}"
-    cached_data = None
-    country_code = "N/A"
+# Прогрев при старте: top-N популярных ключей (0 — выключен) не более чем WARMUP_CONCURRENCY
+# запросами одновременно; до окончания (или WARMUP_TIMEOUT секунд) /health/ready отвечает 503.
+# WARMUP_SNAPSHOT_PATH — снимок кэша (python warmup.py export), загружаемый перед прогревом
+WARMUP_TOP_N = int(os.getenv("WARMUP_TOP_N", "50"))
+WARMUP_CONCURRENCY = int(os.getenv("WARMUP_CONCURRENCY", "5"))
+WARMUP_TIMEOUT = float(os.getenv("WARMUP_TIMEOUT", "120"))
+WARMUP_SNAPSHOT_PATH = os.getenv("WARMUP_SNAPSHOT_PATH")
+
+# Упреждающее обновление top-N самых запрашиваемых городов (0 — выключено)
+REFRESH_AHEAD_TOP_N = int(os.getenv("REFRESH_AHEAD_TOP_N", "0"))
+REFRESH_AHEAD_INTERVAL = float(os.getenv("REFRESH_AHEAD_INTERVAL", "60"))
+REFRESH_AHEAD_MARGIN = float(os.getenv("REFRESH_AHEAD_MARGIN", "300"))
+# Популярность для прогрева и refresh-ahead: запросы за последние POPULARITY_WINDOW_HOURS часов,
+# не больше POPULARITY_MAX_TRACKED ключей в часе
+POPULARITY_WINDOW_HOURS = int(os.getenv("POPULARITY_WINDOW_HOURS", "24"))
+POPULARITY_MAX_TRACKED = int(os.getenv("POPULARITY_MAX_TRACKED", "10000"))
+
+# Объединение одновременных промахов: в процессе всегда, между репликами — через
+# короткую блокировку в Redis, если включено SINGLEFLIGHT_REDIS_LOCK
+SINGLEFLIGHT_REDIS_LOCK = os.getenv("SINGLEFLIGHT_REDIS_LOCK", "false").lower() in ("1", "true", "yes")
+SINGLEFLIGHT_LOCK_TTL_MS = int(os.getenv("SINGLEFLIGHT_LOCK_TTL_MS", "15000"))
+SINGLEFLIGHT_LOCK_WAIT = float(os.getenv("SINGLEFLIGHT_LOCK_WAIT", "10"))
+SINGLEFLIGHT_POLL_INTERVAL = float(os.getenv("SINGLEFLIGHT_POLL_INTERVAL", "0.05"))
+
+# Локальный (в процессе) уровень кэша перед Redis. Запись живёт не дольше
+# LOCAL_CACHE_TTL и не дольше оставшегося TTL ключа в Redis.
+LOCAL_CACHE_MAX_ITEMS = int(os.getenv("LOCAL_CACHE_MAX_ITEMS", "500"))
+LOCAL_CACHE_MAX_BYTES = int(os.getenv("LOCAL_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+LOCAL_CACHE_TTL = float(os.getenv("LOCAL_CACHE_TTL", "30"))
+# Сброс локальных записей по keyspace-уведомлениям Redis (del/expired/evicted)
+LOCAL_CACHE_KEYSPACE_EVENTS = os.getenv("LOCAL_CACHE_KEYSPACE_EVENTS", "false").lower() in ("1", "true", "yes")
+
+# Справочник городов для разрешения названий в id провайдера и автодополнения;
+# несколько файлов — через запятую (раньше указанный важнее), поддерживается .json.gz
+CITY_INDEX_PATH = os.getenv("CITY_INDEX_PATH", os.path.join(os.path.dirname(__file__), "data", "cities.json"))
+CITY_AUTOCOMPLETE_LIMIT = int(os.getenv("CITY_AUTOCOMPLETE_LIMIT", "10"))
+
+# История запросов: записи хранятся HISTORY_RETENTION_HOURS, почасовые агрегаты для топа
+# городов — HISTORY_TOP_RETENTION_HOURS (это и максимум окна /weather_history/top)
+HISTORY_RETENTION_HOURS = int(os.getenv("HISTORY_RETENTION_HOURS", "168"))
+HISTORY_TOP_RETENTION_HOURS = int(os.getenv("HISTORY_TOP_RETENTION_HOURS", "48"))
+HISTORY_MAX_LIMIT = 1000
+
+# Формат ответа /forecast: full — список дневных записей, compact — колонки с индексами строк
+RESPONSE_FORMATS = ("full", "compact")
+
+# Пакетный запрос /forecast/batch: максимум городов и одновременных запросов к провайдеру
+BATCH_MAX_CITIES = int(os.getenv("BATCH_MAX_CITIES", "50"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "10"))
+
+# Поток обновлений /forecast/stream: комментарий-keepalive каждые SSE_KEEPALIVE секунд
+# (прокси не закрывают простаивающее соединение) и очередь событий на подписчика
+SSE_KEEPALIVE = float(os.getenv("SSE_KEEPALIVE", "15"))
+SSE_QUEUE_SIZE = int(os.getenv("SSE_QUEUE_SIZE", "16"))
+
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "50"))
+REDIS_POOL_TIMEOUT = float(os.getenv("REDIS_POOL_TIMEOUT", "5"))
+
+# Клиенты Redis и OpenWeatherMap создаются в startup() — свои в каждом воркере
+redis_pool = None
+redis_client = None
+provider_client = None
+cache_warmer = None
+update_hub = None
+provider_breaker = CircuitBreaker(CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT)
+forecast_flights = SingleFlight()
+local_cache = LocalCache(
+    max_items=LOCAL_CACHE_MAX_ITEMS,
+    max_bytes=LOCAL_CACHE_MAX_BYTES,
+    on_evict=lambda reason: local_cache_evictions.labels(reason=reason).inc(),
+)
+city_index = CityIndex()
+background_tasks = set()
+
+def create_clients():
+    global redis_pool, redis_client, provider_client, cache_warmer, update_hub
+    # Асинхронный пул соединений к Redis: команды не блокируют event loop,
+    # при исчерпании пула запрос ждёт свободное соединение до REDIS_POOL_TIMEOUT
+    redis_pool = aioredis.BlockingConnectionPool(
+        host=REDIS_HOST or "localhost",
+        port=int(REDIS_PORT or 6379),
+        decode_responses=True,
+        max_connections=REDIS_MAX_CONNECTIONS,
+        timeout=REDIS_POOL_TIMEOUT,
+    )
+    redis_client = aioredis.Redis(connection_pool=redis_pool)
+
+    # Общий асинхронный клиент с пулом keep-alive соединений к OpenWeatherMap
+    rate_limiter = None
+    if OPENWEATHER_RATE_LIMIT > 0 or OPENWEATHER_DAILY_QUOTA > 0:
+        rate_limiter = RateLimiter(
+            redis_client,
+            "openweather",
+            # Без лимита по скорости бакет остаётся, но практически не ограничивает
+            rate=OPENWEATHER_RATE_LIMIT or 1000000,
+            capacity=OPENWEATHER_BURST,
+            daily_quota=OPENWEATHER_DAILY_QUOTA,
+            max_wait=OPENWEATHER_RATE_LIMIT_WAIT,
+        )
+    provider_client = ProviderClient(OPENWEATHERMAP_API_KEY, rate_limiter=rate_limiter, breaker=provider_breaker)
+    cache_warmer = CacheWarmer(
+        redis_client,
+        refresh=refresh_forecast,
+        get_fetched_at=get_fetched_at,
+        get_popular=get_popular,
+        top_n=WARMUP_TOP_N,
+        concurrency=WARMUP_CONCURRENCY,
+        soft_ttl=CACHE_SOFT_TTL,
+        timeout=WARMUP_TIMEOUT,
+    )
+    update_hub = UpdateHub(redis_client, queue_size=SSE_QUEUE_SIZE)
+
+async def startup():
+    if not OPENWEATHERMAP_API_KEY:
+        logger.error("OPENWEATHERMAP_API_KEY environment variable is not set")
+        raise ValueError("OPENWEATHERMAP_API_KEY environment variable is not set")
+
+    for path in filter(None, (p.strip() for p in CITY_INDEX_PATH.split(","))):
+        try:
+            city_index.load(path)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not load city index from {path}: {e}")
+    logger.info(f"City index loaded: {len(city_index)} cities")
+
+    create_clients()
     try:
-        cached_data = redis_client.get(cache_key)
+        await redis_client.ping()
+        logger.info(f"Successfully connected to Redis at {REDIS_HOST}:{REDIS_PORT}")
     except redis.exceptions.ConnectionError as e:
-        logger.warning(f"Redis connection error on GET: {e}. Proceeding without cache.")
+        logger.error(f"Failed to connect to Redis at {REDIS_HOST}:{REDIS_PORT} - {e}")
+        raise RuntimeError(f"Failed to connect to Redis: {e}")
+
+    # Прогрев не задерживает старт: воркер принимает запросы, а готовность сообщает /health/ready
+    spawn(cache_warmer.run(WARMUP_SNAPSHOT_PATH))
+    spawn(update_hub.run())
+    if LOCAL_CACHE_KEYSPACE_EVENTS:
+        spawn(listen_keyspace_events())
+    if REFRESH_AHEAD_TOP_N > 0:
+        scheduler = RefreshAheadScheduler(
+            redis_client,
+            refresh=refresh_forecast,
+            get_fetched_at=get_fetched_at,
+            get_popular=get_popular,
+            top_n=REFRESH_AHEAD_TOP_N,
+            interval=REFRESH_AHEAD_INTERVAL,
+            soft_ttl=CACHE_SOFT_TTL,
+            margin=REFRESH_AHEAD_MARGIN,
+        )
+        spawn(scheduler.run())
+
+async def shutdown():
+    for task in list(background_tasks):
+        task.cancel()
+    await provider_client.aclose()
+    await redis_client.aclose()
+    await redis_pool.disconnect()
 
-    result = None
-    forecast_list = None
-    city_name = city
+def spawn(coro):
+    # Держим ссылку на фоновую задачу, чтобы её не собрал GC, и отменяем при остановке
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
 
-    if cached_data:
-        logger.info(f"Cache hit: {cache_key}")
-        redis_cache_hits.inc()
+# Удаление, истечение TTL и вытеснение ключа (перезапись SETEX своей же репликой не в счёт:
+# иначе запись, только что положенная в локальный кэш после промаха, тут же сбрасывалась бы)
+KEYSPACE_INVALIDATING_EVENTS = ("del", "expired", "evicted")
+KEYSPACE_REQUIRED_FLAGS = "Kgxe"
+
+def merge_keyspace_flags(current, required=KEYSPACE_REQUIRED_FLAGS):
+    # notify-keyspace-events — настройка всего сервера: добавляем нужные флаги к уже включённым.
+    # "A" — псевдоним для g$lshzxetd
+    present = set(current.replace("A", "g$lshzxetd"))
+    missing = [flag for flag in required if flag not in present]
+    return current + "".join(missing) if missing else None
+
+async def enable_keyspace_events():
+    try:
+        current = (await redis_client.config_get("notify-keyspace-events")).get("notify-keyspace-events", "")
+        merged = merge_keyspace_flags(current)
+        if merged is not None:
+            await redis_client.config_set("notify-keyspace-events", merged)
+            logger.info(f"Keyspace notifications: {current!r} -> {merged!r}")
+    except redis.exceptions.ResponseError as e:
+        logger.warning(f"Could not enable keyspace notifications: {e}. Relying on local TTL.")
+
+async def listen_keyspace_events():
+    # Удалённые, истёкшие и вытесненные из Redis ключи provider:* сбрасываются и в локальном кэше.
+    # Перезапись другой репликой здесь не видна: локальная копия живёт не дольше LOCAL_CACHE_TTL
+    await enable_keyspace_events()
+    prefix = f"__keyspace@{redis_pool.connection_kwargs.get('db', 0)}__:"
+    while True:
         try:
-            import ast
-            cached_result = ast.literal_eval(cached_data)
-            forecast_list = cached_result["forecast"]
-            city_name = cached_result.get("city", city)
-            country_code = cached_result.get("country", "N/A")
-            result = {"city": city_name, "forecast": forecast_list, "country": country_code, "fromCache": True}
-        except (ValueError, SyntaxError) as e:
-            logger.error(f"Error parsing cached data for {cache_key}: {e}. Fetching fresh data.")
-            cached_data = None
+            async with redis_client.pubsub() as pubsub:
+                await pubsub.psubscribe(f"{prefix}provider:*")
+                logger.info("Listening for keyspace events on provider:* keys")
+                async for message in pubsub.listen():
+                    if message["type"] == "pmessage" and message["data"] in KEYSPACE_INVALIDATING_EVENTS:
+                        local_cache.invalidate(message["channel"][len(prefix):])
+        except redis.exceptions.ConnectionError as e:
+            logger.warning(f"Keyspace listener disconnected: {e}. Reconnecting.")
+            local_cache.clear()
+            await asyncio.sleep(1)
+
+def normalize_city(city):
+    return normalize_name(city)
+
+def provider_cache_key(city, lang):
+    # Ответ /data/2.5/forecast не зависит от days, поэтому кэшируем его один раз на город и язык.
+    # city — id провайдера (после resolve_cities) или нормализованное название
+    return f"provider:{normalize_city(city)}:{lang}"
+
+async def resolve_cities(queries):
+    # Запрос пользователя -> id города у провайдера (строкой), чтобы "Moscow", " moscow" и "Москва"
+    # попадали в один ключ кэша. Сначала справочник в памяти, затем общий hash в Redis.
+    # Неизвестные города провайдер ищет по названию в том виде, как его ввёл пользователь
+    # ("Kraków", а не "krakow"); нормализованное название — только ключ кэша и city_alias
+    targets = {}
+    unknown = []
+    for query in queries:
+        city_id = city_index.resolve(query)
+        if city_id is not None:
+            targets[query] = str(city_id)
+        else:
+            unknown.append(query)
+    if unknown:
+        aliases = [normalize_city(query) for query in unknown]
+        try:
+            with stage("city_resolve"):
+                city_ids = await redis_client.hmget(CITY_ALIAS_KEY, aliases)
+        except redis.exceptions.ConnectionError as e:
+            logger.warning(f"Redis connection error on city alias lookup: {e}")
+            city_ids = [None] * len(unknown)
+        for query, alias, city_id in zip(unknown, aliases, city_ids):
+            if city_id:
+                city_index.remember(alias, city_id)
+            targets[query] = city_id or query.strip()
+    return targets
+
+def learn_city_id(target, lang, payload, encoded, cache_writes, alias_writes, cache_key):
+    # Город вне справочника нашли по названию: запоминаем его id и сразу кладём ответ под ключ по id.
+    # Возвращает ключ, под которым учитывать популярность: следующие запросы придут уже по id,
+    # а ключ по названию прогрев и refresh-ahead не обновляют
+    city_id = payload.get("id")
+    if city_id is None or target.isdigit():
+        return cache_key
+    alias = normalize_city(target)
+    city_index.remember(alias, city_id)
+    alias_writes[alias] = city_id
+    id_key = provider_cache_key(str(city_id), lang)
+    if encoded is not None:
+        cache_writes[id_key] = encoded
+    return id_key
+
+def compact_provider_payload(data, city):
+    # Оставляем из ответа провайдера только поля, нужные для агрегации
+    return {
+        "id": data.get("city", {}).get("id"),
+        "city": data.get("city", {}).get("name", city),
+        "country": data.get("city", {}).get("country", "N/A"),
+        "series": ForecastSeries(
+            [item["dt"] for item in data["list"]],
+            [item["main"]["temp"] for item in data["list"]],
+            [item["weather"][0]["description"] for item in data["list"]],
+            [item["weather"][0]["icon"] for item in data["list"]],
+        ),
+    }
+
+def build_forecast(payload, days):
+    # Одна запись на день (ближайшая к 12:00) с дневными min/max/средней температурой
+    forecast_list = aggregate_daily(payload["series"])
+    days_limit = days if days else 7  # По умолчанию 7 дней
+    if len(forecast_list) > days_limit:
+        forecast_list = forecast_list[:days_limit]
+
+    return {"city": payload["city"], "forecast": forecast_list, "country": payload["country"]}
+
+async def fetch_from_provider(city, lang):
+    logger.info(f"Cache miss or invalid cache data: fetching from OpenWeatherMap for {city}")
+    try:
+        openweather_requests.inc()
+        with stage("upstream_fetch"):
+            data = await provider_client.fetch_forecast(city, lang)
+    except CityNotFoundError:
+        raise HTTPException(status_code=404, detail=f"City '{city}' not found by OpenWeatherMap")
+    except ProviderUnavailableError as e:
+        logger.warning(f"Provider call for {city} skipped: {e}")
+        raise HTTPException(
+            status_code=503,
+            detail="Weather provider is temporarily unavailable",
+            headers={"Retry-After": str(max(1, int(e.retry_after)))},
+        )
+    except ProviderError:
+        raise HTTPException(status_code=503, detail="Failed to fetch weather data from provider")
+
+    if not data.get("list"):
+        logger.error(f"No forecast data ('list') in OpenWeatherMap response for city {city}")
+        raise HTTPException(status_code=404, detail=f"No forecast data available for city '{city}'")
+
+    payload = compact_provider_payload(data, city)
+    payload["fetched_at"] = time.time()
+    return payload
+
+def is_stale(payload):
+    # Записи без fetched_at считаем свежими: их срок ограничен TTL ключа
+    return time.time() - payload.get("fetched_at", time.time()) > CACHE_SOFT_TTL
+
+def queue_cache_write(pipe, cache_key, encoded):
+    # Каждая запись прогноза в кэш публикуется подписчикам /forecast/stream всех реплик
+    pipe.setex(cache_key, CACHE_HARD_TTL, encoded)
+    pipe.publish(updates_channel(cache_key), encoded)
+
+async def write_cache(cache_key, encoded):
+    async with redis_client.pipeline(transaction=False) as pipe:
+        queue_cache_write(pipe, cache_key, encoded)
+        await pipe.execute()
+
+async def store_payload(cache_key, payload):
+    encoded = codec.encode_forecast(payload)
+    local_cache.set(cache_key, payload, len(encoded), min(LOCAL_CACHE_TTL, CACHE_HARD_TTL))
+    await write_cache(cache_key, encoded)
+
+async def refresh_forecast(city, lang, cache_key):
+    # Обновление записи в фоне; при включённой блокировке между репликами
+    # обновляет только та реплика, которая её взяла
+    lock = None
+    try:
+        if SINGLEFLIGHT_REDIS_LOCK:
+            lock = RedisLock(redis_client, f"lock:{cache_key}", SINGLEFLIGHT_LOCK_TTL_MS)
+            if not await lock.acquire():
+                return
+        payload = await fetch_from_provider(city, lang)
+        await store_payload(cache_key, payload)
+        logger.info(f"Refreshed {cache_key} in background")
+    except HTTPException as e:
+        logger.warning(f"Background refresh of {cache_key} failed: {e.detail}")
+        if e.status_code == 503:
+            # Провайдер недоступен: продлеваем устаревшую запись, чтобы не потерять её по жёсткому TTL
+            try:
+                await redis_client.expire(cache_key, CACHE_STALE_EXTEND, gt=True)
+            except redis.exceptions.ConnectionError as e:
+                logger.warning(f"Redis connection error on TTL extend of {cache_key}: {e}")
+    except redis.exceptions.ConnectionError as e:
+        logger.warning(f"Redis connection error on background refresh of {cache_key}: {e}")
+    finally:
+        if lock is not None:
             try:
-                redis_client.delete(cache_key)
-            except redis.exceptions.ConnectionError as redis_err:
-                logger.warning(f"Redis connection error on DELETE: {redis_err}.")
-
-    if not cached_data:
-        logger.info(f"Cache miss or invalid cache data: fetching from OpenWeatherMap for {city}")
-        redis_cache_misses.inc()
-        params = {"q": city, "appid": OPENWEATHERMAP_API_KEY, "units": "metric", "lang": lang}
+                await lock.release()
+            except redis.exceptions.ConnectionError as e:
+                logger.warning(f"Redis connection error on lock release: {e}. Lock will expire.")
+
+def refresh_in_background(city, lang, cache_key):
+    # Несколько запросов к устаревшей записи запускают одно обновление
+    if f"refresh:{cache_key}" not in forecast_flights:
+        spawn(forecast_flights.do(f"refresh:{cache_key}", lambda: refresh_forecast(city, lang, cache_key)))
+
+async def get_fetched_at(cache_keys):
+    values = await redis_client.mget(cache_keys)
+    fetched_at = []
+    for raw in values:
         try:
-            response = requests.get("http://api.openweathermap.org/data/2.5/forecast", params=params)
-            openweather_requests.inc()
-            response.raise_for_status()
-            logger.info(f"OpenWeatherMap response status: {response.status_code} for city {city}")
-        except requests.exceptions.RequestException as e:
-            logger.error(f"OpenWeatherMap request failed for city {city}: {e}")
-            if isinstance(e, requests.exceptions.HTTPError) and e.response.status_code == 404:
-                raise HTTPException(status_code=404, detail=f"City '{city}' not found by OpenWeatherMap")
-            raise HTTPException(status_code=503, detail="Failed to fetch weather data from provider")
-
-        data = response.json()
-        if not data.get("list"):
-            logger.error(f"No forecast data ('list') in OpenWeatherMap response for city {city}")
-            raise HTTPException(status_code=404, detail=f"No forecast data available for city '{city}'")
-
-        # Группируем данные по дням и выбираем одну запись на день (ближайшую к 12:00)
-        forecast_dict = {}
-        for item in data["list"]:
-            forecast_date = datetime.strptime(item["dt_txt"], "%Y-%m-%d %H:%M:%S")
-            day_key = forecast_date.strftime("%Y-%m-%d")
-            if day_key not in forecast_dict:
-                forecast_dict[day_key] = item
-            # Выбираем запись ближе к 12:00 (индекс 11:00-13:00)
-            current_hour = forecast_date.hour
-            existing_hour = datetime.strptime(forecast_dict[day_key]["dt_txt"], "%Y-%m-%d %H:%M:%S").hour
-            if abs(12 - current_hour) < abs(12 - existing_hour):
-                forecast_dict[day_key] = item
-
-        # Преобразуем в список, ограничиваем по дням
-        forecast_list = [
-            {
-                "date": item["dt_txt"],
-                "temperature": item["main"]["temp"],
-                "description": item["weather"][0]["description"],
-                "icon": item["weather"][0]["icon"]
-            }
-            for day, item in forecast_dict.items()
-        ]
-        days_limit = days if days else 7  # По умолчанию 7 дней
-        if len(forecast_list) > days_limit:
-            forecast_list = forecast_list[:days_limit]
-
-        city_name = data.get("city", {}).get("name", city)
-        country_code = data.get("city", {}).get("country", "N/A")
-        result = {"city": city_name, "forecast": forecast_list, "country": country_code, "fromCache": False}
+            fetched_at.append(codec.decode_forecast(raw).get("fetched_at") if raw else None)
+        except CodecError:
+            fetched_at.append(None)
+    return fetched_at
 
+async def get_popular(limit):
+    return await top_popular(redis_client, limit, time.time(), POPULARITY_WINDOW_HOURS)
+
+async def wait_for_cache(cache_key):
+    # Другая реплика уже запрашивает провайдера: ждём, пока она положит результат в кэш
+    deadline = time.monotonic() + SINGLEFLIGHT_LOCK_WAIT
+    while time.monotonic() < deadline:
+        await asyncio.sleep(SINGLEFLIGHT_POLL_INTERVAL)
+        cached_data = await redis_client.get(cache_key)
+        if cached_data:
+            try:
+                return codec.decode_forecast(cached_data)
+            except CodecError:
+                return None
+    return None
+
+async def load_forecast(city, lang, cache_key):
+    # Возвращает (payload, needs_cache_write)
+    if not SINGLEFLIGHT_REDIS_LOCK:
+        return await fetch_from_provider(city, lang), True
+
+    lock = RedisLock(redis_client, f"lock:{cache_key}", SINGLEFLIGHT_LOCK_TTL_MS)
+    try:
+        acquired = await lock.acquire()
+    except redis.exceptions.ConnectionError as e:
+        logger.warning(f"Redis connection error on lock acquire: {e}. Fetching without lock.")
+        return await fetch_from_provider(city, lang), True
+
+    if not acquired:
         try:
-            cache_data = {"city": city_name, "forecast": forecast_list, "country": country_code}
-            redis_client.setex(cache_key, 3600, str(cache_data))
-            logger.info(f"Saved forecast for {city_name} to cache {cache_key}")
+            cache_data = await wait_for_cache(cache_key)
         except redis.exceptions.ConnectionError as e:
-            logger.warning(f"Redis connection error on SETEX: {e}. Proceeding without caching.")
+            logger.warning(f"Redis connection error while waiting for {cache_key}: {e}.")
+            cache_data = None
+        if cache_data is not None:
+            logger.info(f"Got {cache_key} from another replica's fetch")
+            return cache_data, False
+        return await fetch_from_provider(city, lang), True
+
+    try:
+        cache_data = await fetch_from_provider(city, lang)
+        # Под блокировкой пишем кэш сразу, чтобы ожидающие реплики его увидели
+        await write_cache(cache_key, codec.encode_forecast(cache_data))
+        return cache_data, False
+    finally:
+        try:
+            await lock.release()
+        except redis.exceptions.ConnectionError as e:
+            logger.warning(f"Redis connection error on lock release: {e}. Lock will expire.")
+
+def parse_cached(cache_key, cached_data, ttl_ms):
+    # Разбирает значение из Redis; битая запись считается промахом и будет перезаписана через SETEX
+    logger.info(f"Cache hit: {cache_key}")
+    redis_cache_hits.inc()
+    try:
+        with stage("deserialize"):
+            payload = codec.decode_forecast(cached_data)
+    except (CodecError, KeyError, TypeError) as e:
+        logger.error(f"Error parsing cached data for {cache_key}: {e}. Fetching fresh data.")
+        return None
+    # TTL нужен, чтобы локальная копия не пережила запись в Redis
+    if ttl_ms > 0:
+        local_cache.set(cache_key, payload, len(cached_data), min(LOCAL_CACHE_TTL, ttl_ms / 1000))
+    return payload
+
+async def fetch_payload(city, lang, cache_key):
+    # Возвращает (payload, encoded): encoded — значение для SETEX, если писать в кэш должен этот запрос
+    redis_cache_misses.inc()
+    # Одновременные промахи по одному ключу делят один запрос к провайдеру
+    (payload, needs_cache_write), leader = await forecast_flights.do(
+        cache_key, lambda: load_forecast(city, lang, cache_key)
+    )
+    if not leader:
+        return payload, None
+    encoded = codec.encode_forecast(payload)
+    local_cache.set(cache_key, payload, len(encoded), min(LOCAL_CACHE_TTL, CACHE_HARD_TTL))
+    return payload, encoded if needs_cache_write else None
+
+def render_forecast(city, lang, cache_key, payload, days, from_cache):
+    # Нарезка по days и дневная агрегация — дешёвый шаг после чтения из кэша
+    with stage("aggregation"):
+        forecast = build_forecast(payload, days)
+    stale = from_cache and is_stale(payload)
+    if stale:
+        # Отдаём устаревшие данные сразу, а свежие подтягиваем в фоне
+        logger.info(f"Serving stale {cache_key}, scheduling background refresh")
+        refresh_in_background(city, lang, cache_key)
+    return {**forecast, "fromCache": from_cache, "stale": stale}
 
-    if forecast_list:
+def forecast_cache_headers(cache_key, payload, days, stale, response_format):
+    # Валидаторы считаются от времени получения данных у провайдера
+    fetched_at = payload.get("fetched_at")
+    if fetched_at is None:
+        return {"cache_control": "no-cache"}
+    max_age = 0 if stale else int(min(HTTP_CACHE_MAX_AGE, max(0, CACHE_SOFT_TTL - (time.time() - fetched_at))))
+    return {
+        "etag": make_etag(cache_key, fetched_at, days, response_format),
+        "last_modified": fetched_at,
+        "cache_control": f"public, max-age={max_age}, stale-while-revalidate={HTTP_STALE_WHILE_REVALIDATE}",
+    }
+
+def check_response_format(response_format):
+    if response_format not in RESPONSE_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown format, expected one of: {', '.join(RESPONSE_FORMATS)}")
+
+def format_result(result, response_format):
+    # format=compact: дневные записи колонками (см. forecast_model.compact_forecast)
+    if response_format == "compact":
+        return {**result, "forecast": compact_forecast(result["forecast"]), "format": "compact"}
+    return result
+
+def make_history_entry(result):
+    forecast_list = result["forecast"]
+    city_name = result["city"]
+    if not forecast_list:
+        return None
+    # Сводка за первый день уже посчитана в aggregate_daily
+    first_day = forecast_list[0]
+    logger.info(f"Aggregated data for {city_name}: avg_temp={first_day['temp_avg']:.2f}, descr='{first_day['dominant_description']}', icon='{first_day['icon']}'")
+    return {
+        "city": city_name,
+        "forecast_date": first_day["date"][:10],
+        "avg_temperature": first_day["temp_avg"],
+        "description": first_day["dominant_description"],
+        "icon": first_day["icon"],
+        "request_time": datetime.utcnow().isoformat() + "Z"
+    }
+
+async def save_request_results(cache_writes, history_entries, requested_keys, alias_writes=None):
+    # Запись в кэш, в историю и счётчик популярности отправляем одним пакетом (MULTI/EXEC)
+    try:
+        async with redis_client.pipeline(transaction=True) as pipe:
+            for cache_key, encoded in cache_writes.items():
+                queue_cache_write(pipe, cache_key, encoded)
+            if alias_writes:
+                pipe.hset(CITY_ALIAS_KEY, mapping=alias_writes)
+            if history_entries:
+                history.add_entries(
+                    pipe, history_entries, time.time(),
+                    retention=HISTORY_RETENTION_HOURS * 3600, bucket_ttl=HISTORY_TOP_RETENTION_HOURS * 3600,
+                )
+            if requested_keys:
+                record_popularity(
+                    pipe, requested_keys, time.time(),
+                    window_hours=POPULARITY_WINDOW_HOURS, max_tracked=POPULARITY_MAX_TRACKED,
+                )
+            # Запись кэша и истории — один pipeline, поэтому и один этап
+            with stage("cache_history_write"):
+                await pipe.execute()
+        for cache_key in cache_writes:
+            logger.info(f"Saved forecast to cache {cache_key}")
+        for entry in history_entries:
+            logger.info(f"Saved history entry for {entry['city']}")
+    except redis.exceptions.ConnectionError as e:
+        logger.warning(f"Redis connection error on cache/history write: {e}. Proceeding without caching.")
+
+# Объявлен до /forecast/{city}, иначе "batch" будет принят за название города
+@app.get("/forecast/batch")
+async def get_forecast_batch(
+    cities: str, lang: str = "en", days: int = None, response_format: str = Query("full", alias="format")
+):
+    queries = list(dict.fromkeys(c.strip() for c in cities.split(",") if c.strip()))
+    logger.info(f"Received batch request: cities={queries}, lang={lang}, days={days}")
+    if not queries:
+        raise HTTPException(status_code=400, detail="No cities given")
+    if len(queries) > BATCH_MAX_CITIES:
+        raise HTTPException(status_code=400, detail=f"Too many cities, at most {BATCH_MAX_CITIES} per request")
+    check_response_format(response_format)
+
+    targets = await resolve_cities(queries)
+    cache_keys = {query: provider_cache_key(targets[query], lang) for query in queries}
+    payloads = {}
+    remote_keys = []
+    for query in queries:
+        payload = local_cache.get(cache_keys[query])
+        if payload is not None:
+            local_cache_hits.inc()
+            payloads[query] = payload
+        else:
+            local_cache_misses.inc()
+            remote_keys.append(cache_keys[query])
+
+    if remote_keys:
+        remote_keys = list(dict.fromkeys(remote_keys))
+        try:
+            # Все города, которых нет в локальном кэше, — одним MGET (и их PTTL в том же round trip)
+            async with redis_client.pipeline(transaction=False) as pipe:
+                pipe.mget(remote_keys)
+                for cache_key in remote_keys:
+                    pipe.pttl(cache_key)
+                with stage("cache_lookup"):
+                    cached_values, *ttls = await pipe.execute()
+        except redis.exceptions.ConnectionError as e:
+            logger.warning(f"Redis connection error on MGET: {e}. Proceeding without cache.")
+            cached_values, ttls = [None] * len(remote_keys), [-2] * len(remote_keys)
+        parsed = {
+            cache_key: parse_cached(cache_key, cached_data, ttl_ms)
+            for cache_key, cached_data, ttl_ms in zip(remote_keys, cached_values, ttls)
+            if cached_data
+        }
+        for query in queries:
+            if query not in payloads and parsed.get(cache_keys[query]) is not None:
+                payloads[query] = parsed[cache_keys[query]]
+
+    # Промахи запрашиваем у провайдера параллельно, но не больше BATCH_MAX_CONCURRENCY одновременно
+    semaphore = asyncio.Semaphore(BATCH_MAX_CONCURRENCY)
+
+    async def fetch_one(query):
+        async with semaphore:
+            return await fetch_payload(targets[query], lang, cache_keys[query])
+
+    misses = [query for query in queries if query not in payloads]
+    fetched = dict(zip(misses, await asyncio.gather(*[fetch_one(q) for q in misses], return_exceptions=True)))
+
+    results = []
+    errors = []
+    cache_writes = {}
+    alias_writes = {}
+    history_entries = []
+    popular_keys = []
+    for query in queries:
+        cache_key = cache_keys[query]
+        popular_key = cache_key
+        if query in payloads:
+            result = render_forecast(targets[query], lang, cache_key, payloads[query], days, True)
+        else:
+            outcome = fetched[query]
+            if isinstance(outcome, HTTPException):
+                errors.append({"query": query, "status": outcome.status_code, "detail": outcome.detail})
+                continue
+            if isinstance(outcome, Exception):
+                logger.error(f"Batch fetch failed for {query}: {outcome!r}")
+                errors.append({"query": query, "status": 500, "detail": "Internal server error processing request."})
+                continue
+            payload, encoded = outcome
+            if encoded is not None:
+                cache_writes[cache_key] = encoded
+            popular_key = learn_city_id(
+                targets[query], lang, payload, encoded, cache_writes, alias_writes, cache_key
+            )
+            result = render_forecast(targets[query], lang, cache_key, payload, days, False)
+        history_entry = make_history_entry(result)
+        if history_entry is not None:
+            history_entries.append(history_entry)
+        popular_keys.append(popular_key)
+        results.append({"query": query, **format_result(result, response_format)})
+
+    await save_request_results(cache_writes, history_entries, popular_keys, alias_writes)
+    return {"results": results, "errors": errors}
+
+def forecast_event(query, forecast, payload):
+    data = json.dumps({"query": query, **forecast, "fetchedAt": payload.get("fetched_at")}, ensure_ascii=False)
+    return f"event: forecast\ndata: {data}\n\n"
+
+def error_event(query, status, detail):
+    data = json.dumps({"query": query, "status": status, "detail": detail}, ensure_ascii=False)
+    return f"event: error\ndata: {data}\n\n"
+
+def decode_update(cache_key, cached_data):
+    try:
+        return codec.decode_forecast(cached_data)
+    except CodecError as e:
+        logger.error(f"Error parsing cached data for {cache_key}: {e}")
+        return None
+
+# Объявлен до /forecast/{city}, иначе "stream" будет принят за название города
+@app.get("/forecast/stream")
+async def stream_forecasts(cities: str, lang: str = "en", days: int = None):
+    # Server-sent events: сначала текущий прогноз по каждому городу, затем событие при каждой
+    # записи прогноза в кэш (фоновое обновление, refresh-ahead, запрос другого клиента) на любой реплике
+    queries = list(dict.fromkeys(c.strip() for c in cities.split(",") if c.strip()))
+    logger.info(f"Received stream request: cities={queries}, lang={lang}, days={days}")
+    if not queries:
+        raise HTTPException(status_code=400, detail="No cities given")
+    if len(queries) > BATCH_MAX_CITIES:
+        raise HTTPException(status_code=400, detail=f"Too many cities, at most {BATCH_MAX_CITIES} per request")
+
+    targets = await resolve_cities(queries)
+    queries_by_key = {}
+    for query in queries:
+        queries_by_key.setdefault(provider_cache_key(targets[query], lang), []).append(query)
+    # Подписываемся до чтения кэша, чтобы не пропустить запись между чтением и подпиской
+    queue = update_hub.subscribe(queries_by_key)
+
+    def events_for(cache_key, payload):
+        # Город вне справочника после первого ответа обновляется уже под ключом по id
+        city_id = payload.get("id")
+        if city_id is not None:
+            id_key = provider_cache_key(str(city_id), lang)
+            if id_key not in queries_by_key:
+                queries_by_key[id_key] = queries_by_key[cache_key]
+                update_hub.subscribe([id_key], queue)
+        forecast = build_forecast(payload, days)
+        return "".join(forecast_event(query, forecast, payload) for query in queries_by_key[cache_key])
+
+    async def events():
         try:
-            first_day_str = forecast_list[0]["date"].split(" ")[0]
-            first_day_forecasts = [f for f in forecast_list if f["date"].startswith(first_day_str)]
-
-            if not first_day_forecasts:
-                logger.error(f"No forecasts found for the first day ({first_day_str}) in the list for city {city_name}")
-                raise ValueError(f"No forecasts for the first day ({first_day_str})")
-
-            avg_temperature = mean([f["temperature"] for f in first_day_forecasts])
-            descriptions = Counter([f["description"] for f in first_day_forecasts])
-            most_common_description = descriptions.most_common(1)[0][0]
-            icon = first_day_forecasts[0]["icon"]
-
-            logger.info(f"Aggregated data for {city_name}: avg_temp={avg_temperature:.2f}, descr='{most_common_description}', icon='{icon}'")
-
-            history_entry = {
-                "city": city_name,
-                "forecast_date": first_day_str,
-                "avg_temperature": round(avg_temperature, 2),
-                "description": most_common_description,
-                "icon": icon,
-                "request_time": datetime.utcnow().isoformat() + "Z"
-            }
             try:
-                redis_client.lpush("weather_history", str(history_entry))
-                redis_client.ltrim("weather_history", 0, 99)
-                logger.info(f"Saved history entry for {city_name}")
+                cached_values = await redis_client.mget(list(queries_by_key))
             except redis.exceptions.ConnectionError as e:
-                logger.warning(f"Redis connection error on LPUSH/LTRIM: {e}. History not saved.")
+                logger.warning(f"Redis connection error on MGET: {e}. Streaming without initial data.")
+                cached_values = [None] * len(queries_by_key)
+            for cache_key, cached_data in list(zip(queries_by_key, cached_values)):
+                payload = decode_update(cache_key, cached_data) if cached_data else None
+                if payload is not None:
+                    yield events_for(cache_key, payload)
+                    continue
+                # Промах: прогноз запрашивается у провайдера, а запись в кэш придёт событием из очереди
+                target = targets[queries_by_key[cache_key][0]]
+                try:
+                    payload, encoded = await fetch_payload(target, lang, cache_key)
+                except HTTPException as e:
+                    for query in queries_by_key[cache_key]:
+                        yield error_event(query, e.status_code, e.detail)
+                    continue
+                cache_writes = {}
+                alias_writes = {}
+                if encoded is not None:
+                    cache_writes[cache_key] = encoded
+                popular_key = learn_city_id(target, lang, payload, encoded, cache_writes, alias_writes, cache_key)
+                if cache_writes or alias_writes:
+                    await save_request_results(cache_writes, [], [popular_key], alias_writes)
+            while True:
+                try:
+                    cache_key, cached_data = await asyncio.wait_for(queue.get(), SSE_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                payload = decode_update(cache_key, cached_data)
+                if payload is not None:
+                    yield events_for(cache_key, payload)
+        finally:
+            update_hub.unsubscribe(queue, queries_by_key)
 
-        except Exception as e:
-            logger.error(f"Failed to aggregate forecast data or save history for {city_name}: {e}", exc_info=True)
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # X-Accel-Buffering: nginx отдаёт события без буферизации
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
-    if result is None:
-        logger.error(f"Result is unexpectedly None at the end of get_forecast for city {city}")
-        raise HTTPException(status_code=500, detail="Internal server error processing request.")
+@app.get("/forecast/{city}")
+async def get_forecast(
+    request: Request, response: Response, city: str, lang: str = "en", days: int = None,
+    response_format: str = Query("full", alias="format"),
+):
+    logger.info(f"Received request: city={city}, lang={lang}, days={days}, format={response_format}")
+    check_response_format(response_format)
+    target = (await resolve_cities([city]))[city]
+    cache_key = provider_cache_key(target, lang)
 
-    return result
+    payload = local_cache.get(cache_key)
+    if payload is not None:
+        local_cache_hits.inc()
+    else:
+        local_cache_misses.inc()
+        try:
+            # GET и PTTL одним round trip
+            async with redis_client.pipeline(transaction=False) as pipe:
+                pipe.get(cache_key)
+                pipe.pttl(cache_key)
+                with stage("cache_lookup"):
+                    cached_data, ttl_ms = await pipe.execute()
+            if cached_data:
+                payload = parse_cached(cache_key, cached_data, ttl_ms)
+        except redis.exceptions.ConnectionError as e:
+            logger.warning(f"Redis connection error on GET: {e}. Proceeding without cache.")
+
+    cache_writes = {}
+    alias_writes = {}
+    popular_key = cache_key
+    if payload is not None:
+        result = render_forecast(target, lang, cache_key, payload, days, True)
+    else:
+        payload, encoded = await fetch_payload(target, lang, cache_key)
+        if encoded is not None:
+            cache_writes[cache_key] = encoded
+        popular_key = learn_city_id(target, lang, payload, encoded, cache_writes, alias_writes, cache_key)
+        result = render_forecast(target, lang, cache_key, payload, days, False)
+
+    history_entry = make_history_entry(result)
+    await save_request_results(cache_writes, [history_entry] if history_entry else [], [popular_key], alias_writes)
+    not_modified = apply_cache_headers(
+        request, response, **forecast_cache_headers(cache_key, payload, days, result["stale"], response_format)
+    )
+    return not_modified or format_result(result, response_format)
+
+async def read_legacy_history(limit):
+    # Записи в старом формате (список JSON), пока поток ещё пуст после обновления
+    history_str = await redis_client.lrange(history.LEGACY_HISTORY_KEY, 0, limit - 1)
+    entries = []
+    for entry_str in history_str:
+        try:
+            entries.append(codec.decode(entry_str))
+        except CodecError as e:
+            logger.warning(f"Could not parse history entry: {entry_str[:100]}... Error: {e}")
+    return entries
 
 @app.get("/weather_history")
-async def get_weather_history(limit: int = 10):
-    limit = min(max(1, limit), 100)
+async def get_weather_history(request: Request, response: Response, limit: int = 10):
+    limit = min(max(1, limit), HISTORY_MAX_LIMIT)
     logger.info(f"Fetching weather history, limit={limit}")
     try:
-        history_str = redis_client.lrange("weather_history", 0, limit - 1)
-        import ast
-        history = []
-        for entry_str in history_str:
-            try:
-                history.append(ast.literal_eval(entry_str))
-            except (ValueError, SyntaxError) as e:
-                logger.warning(f"Could not parse history entry: {entry_str[:100]}... Error: {e}")
+        with stage("history_read"):
+            records = await redis_client.xrevrange(history.HISTORY_STREAM_KEY, count=limit)
+        if not records:
+            return {"history": await read_legacy_history(limit)}
+        # Новая запись в поток меняет id первой записи — этого достаточно для ETag
+        not_modified = apply_cache_headers(
+            request, response, etag=make_etag(limit, records[0][0], len(records)),
+            cache_control=f"public, max-age={HTTP_HISTORY_MAX_AGE}",
+        )
+        if not_modified is not None:
+            return not_modified
+        with stage("history_deserialize"):
+            entries = [history.parse_entry(entry_id, fields) for entry_id, fields in records]
 
-        logger.info(f"Fetched {len(history)} history records")
-        return {"history": history}
+        logger.info(f"Fetched {len(entries)} history records")
+        return {"history": entries}
     except redis.exceptions.ConnectionError as e:
         logger.error(f"Redis connection error while fetching history: {e}")
         raise HTTPException(status_code=503, detail="Cache service unavailable")
     except Exception as e:
         logger.error(f"Failed to fetch or parse weather history: {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail="Failed to fetch weather history")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="Failed to fetch weather history")
+
+@app.get("/weather_history/top")
+async def get_top_cities(response: Response, hours: int = 1, limit: int = 10):
+    hours = min(max(1, hours), HISTORY_TOP_RETENTION_HOURS)
+    limit = min(max(1, limit), 100)
+    try:
+        with stage("history_top"):
+            cities = await history.top_cities(redis_client, hours, limit, time.time())
+    except redis.exceptions.ConnectionError as e:
+        logger.error(f"Redis connection error while fetching top cities: {e}")
+        raise HTTPException(status_code=503, detail="Cache service unavailable")
+    response.headers["Cache-Control"] = f"public, max-age={HTTP_HISTORY_MAX_AGE}"
+    return {"hours": hours, "cities": cities}
+
+@app.get("/cities/autocomplete")
+async def autocomplete_cities(response: Response, q: str, limit: int = CITY_AUTOCOMPLETE_LIMIT):
+    # Подсказки из справочника в памяти, без обращения к провайдеру и Redis
+    limit = min(max(1, limit), 50)
+    response.headers["Cache-Control"] = "public, max-age=3600"
+    return {"cities": city_index.autocomplete(q, limit)}
+
+@app.get("/health/live")
+async def health_live():
+    return {"status": "ok"}
+
+@app.get("/health/ready")
+async def health_ready(response: Response):
+    # Готов, когда доступен Redis и закончен прогрев кэша
+    checks = {"redis": True, "warmup": bool(cache_warmer and cache_warmer.done)}
+    try:
+        await redis_client.ping()
+    except redis.exceptions.RedisError:
+        checks["redis"] = False
+    ready = all(checks.values())
+    if not ready:
+        response.status_code = 503
+    return {"status": "ready" if ready else "not ready", "checks": checks}
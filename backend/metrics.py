@@ -0,0 +1,77 @@
+import logging
+import os
+import time
+from contextlib import contextmanager, nullcontext
+
+from prometheus_client import Counter, Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+# Гистограммы по этапам обработки запроса и (опционально) спаны OpenTelemetry
+STAGE_METRICS_ENABLED = os.getenv("STAGE_METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+OTEL_TRACING_ENABLED = os.getenv("OTEL_TRACING_ENABLED", "false").lower() in ("1", "true", "yes")
+
+stage_duration = Histogram(
+    name='forecast_stage_duration_seconds',
+    documentation='Duration of request processing stages',
+    labelnames=['stage'],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+)
+upstream_inflight = Gauge(
+    name='openweather_inflight_requests',
+    documentation='Number of requests to OpenWeatherMap currently in flight',
+    # При нескольких воркерах (PROMETHEUS_MULTIPROC_DIR) — сумма по живым процессам
+    multiprocess_mode='livesum'
+)
+upstream_retries = Counter(
+    name='openweather_retries_total',
+    documentation='Number of retried requests to OpenWeatherMap'
+)
+circuit_state = Gauge(
+    name='openweather_circuit_state',
+    documentation='OpenWeatherMap circuit breaker state: 0 closed, 1 half-open, 2 open',
+    multiprocess_mode='livemax'
+)
+rate_limited = Counter(
+    name='openweather_rate_limited_total',
+    documentation='Provider calls rejected by the shared rate limiter or the daily quota',
+    labelnames=['reason']
+)
+quota_used = Gauge(
+    name='openweather_quota_used',
+    documentation='OpenWeatherMap calls made today (UTC) across all replicas',
+    multiprocess_mode='livemostrecent'
+)
+quota_limit = Gauge(
+    name='openweather_quota_limit',
+    documentation='Daily OpenWeatherMap call budget, 0 means unlimited',
+    multiprocess_mode='livemax'
+)
+
+tracer = None
+if OTEL_TRACING_ENABLED:
+    try:
+        # Экспортёр настраивается стандартными переменными OTEL_* (например, через opentelemetry-instrument)
+        from opentelemetry import trace
+        tracer = trace.get_tracer("weather-backend")
+    except ImportError:
+        logger.warning("OTEL_TRACING_ENABLED is set but opentelemetry-api is not installed. Tracing disabled.")
+
+_stage_histograms = {}
+
+
+@contextmanager
+def stage(name):
+    if not STAGE_METRICS_ENABLED and tracer is None:
+        yield
+        return
+    with tracer.start_as_current_span(name) if tracer is not None else nullcontext():
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            if STAGE_METRICS_ENABLED:
+                histogram = _stage_histograms.get(name)
+                if histogram is None:
+                    histogram = _stage_histograms[name] = stage_duration.labels(stage=name)
+                histogram.observe(time.perf_counter() - started)
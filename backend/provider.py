@@ -0,0 +1,145 @@
+import asyncio
+import logging
+import os
+import random
+
+import httpx
+
+from metrics import upstream_inflight, upstream_retries
+from resilience import RateLimitedError
+
+logger = logging.getLogger(__name__)
+
+OPENWEATHERMAP_BASE_URL = os.getenv("OPENWEATHERMAP_BASE_URL", "http://api.openweathermap.org")
+
+# Таймауты и размер пула соединений к OpenWeatherMap (секунды / штуки)
+OPENWEATHER_CONNECT_TIMEOUT = float(os.getenv("OPENWEATHER_CONNECT_TIMEOUT", "3"))
+OPENWEATHER_READ_TIMEOUT = float(os.getenv("OPENWEATHER_READ_TIMEOUT", "10"))
+OPENWEATHER_POOL_TIMEOUT = float(os.getenv("OPENWEATHER_POOL_TIMEOUT", "5"))
+OPENWEATHER_MAX_CONNECTIONS = int(os.getenv("OPENWEATHER_MAX_CONNECTIONS", "50"))
+OPENWEATHER_MAX_KEEPALIVE = int(os.getenv("OPENWEATHER_MAX_KEEPALIVE", "20"))
+OPENWEATHER_KEEPALIVE_EXPIRY = float(os.getenv("OPENWEATHER_KEEPALIVE_EXPIRY", "30"))
+# Максимум одновременных запросов к провайдеру из одного процесса
+OPENWEATHER_MAX_CONCURRENCY = int(os.getenv("OPENWEATHER_MAX_CONCURRENCY", "20"))
+# Повторы при сетевых ошибках, 429 и 5xx: пауза случайная в [0, backoff * 2^attempt]
+OPENWEATHER_RETRIES = int(os.getenv("OPENWEATHER_RETRIES", "2"))
+OPENWEATHER_RETRY_BACKOFF = float(os.getenv("OPENWEATHER_RETRY_BACKOFF", "0.2"))
+# Пауза для всех реплик после 429, если провайдер не прислал Retry-After (секунды)
+OPENWEATHER_THROTTLE_PAUSE = float(os.getenv("OPENWEATHER_THROTTLE_PAUSE", "10"))
+
+
+class ProviderError(Exception):
+    pass
+
+
+class CityNotFoundError(ProviderError):
+    pass
+
+
+class ProviderRequestError(ProviderError):
+    # Провайдер отклонил запрос (4xx, кроме 404 и 429): повтор не поможет
+    pass
+
+
+class ProviderUnavailableError(ProviderError):
+    # Запрос к провайдеру не выполнялся: цепь разомкнута, лимит или квота исчерпаны
+    def __init__(self, message, retry_after=0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def retry_after_seconds(response, default):
+    try:
+        return max(0.0, float(response.headers.get("Retry-After", default)))
+    except ValueError:
+        return default
+
+
+class ProviderClient:
+    def __init__(self, api_key, base_url=OPENWEATHERMAP_BASE_URL, transport=None, rate_limiter=None, breaker=None):
+        self.api_key = api_key
+        self.rate_limiter = rate_limiter
+        self.breaker = breaker
+        self._semaphore = asyncio.Semaphore(OPENWEATHER_MAX_CONCURRENCY)
+        self._client = httpx.AsyncClient(
+            base_url=base_url,
+            timeout=httpx.Timeout(
+                OPENWEATHER_READ_TIMEOUT,
+                connect=OPENWEATHER_CONNECT_TIMEOUT,
+                pool=OPENWEATHER_POOL_TIMEOUT,
+            ),
+            limits=httpx.Limits(
+                max_connections=OPENWEATHER_MAX_CONNECTIONS,
+                max_keepalive_connections=OPENWEATHER_MAX_KEEPALIVE,
+                keepalive_expiry=OPENWEATHER_KEEPALIVE_EXPIRY,
+            ),
+            transport=transport,
+        )
+
+    async def fetch_forecast(self, city: str, lang: str = "en"):
+        if self.breaker is not None and not self.breaker.allow():
+            raise ProviderUnavailableError("Circuit breaker is open", self.breaker.retry_after())
+        # Числовой city — id города у OpenWeatherMap (из справочника), иначе поиск по названию
+        params = {"id" if city.isdigit() else "q": city, "appid": self.api_key, "units": "metric", "lang": lang}
+        error = None
+        for attempt in range(OPENWEATHER_RETRIES + 1):
+            if attempt:
+                upstream_retries.inc()
+                await asyncio.sleep(random.uniform(0, OPENWEATHER_RETRY_BACKOFF * 2 ** (attempt - 1)))
+            try:
+                response = await self._request(city, params)
+            except CityNotFoundError:
+                # Провайдер ответил — он здоров, просто город неизвестен
+                self._record("success")
+                raise
+            except ProviderRequestError:
+                self._record("failure")
+                raise
+            except RateLimitedError as e:
+                self._record("skipped")
+                raise ProviderUnavailableError(str(e), e.retry_after) from e
+            except ProviderError as e:
+                error = e
+                continue
+            self._record("success")
+            logger.info(f"OpenWeatherMap response status: {response.status_code} for city {city}")
+            return response.json()
+        self._record("failure")
+        raise error
+
+    async def _request(self, city, params):
+        if self.rate_limiter is not None:
+            await self.rate_limiter.acquire()
+        async with self._semaphore:
+            try:
+                with upstream_inflight.track_inprogress():
+                    response = await self._client.get("/data/2.5/forecast", params=params)
+                response.raise_for_status()
+            except httpx.HTTPStatusError as e:
+                logger.error(f"OpenWeatherMap request failed for city {city}: {e}")
+                status = e.response.status_code
+                if status == 404:
+                    raise CityNotFoundError(city) from e
+                if status == 429 and self.rate_limiter is not None:
+                    await self.rate_limiter.pause(retry_after_seconds(e.response, OPENWEATHER_THROTTLE_PAUSE))
+                if status != 429 and status < 500:
+                    raise ProviderRequestError(str(e)) from e
+                raise ProviderError(str(e)) from e
+            except httpx.HTTPError as e:
+                logger.error(f"OpenWeatherMap request failed for city {city}: {e!r}")
+                raise ProviderError(str(e)) from e
+        return response
+
+    def _record(self, outcome):
+        if self.breaker is None:
+            return
+        if outcome == "success":
+            self.breaker.record_success()
+        elif outcome == "failure":
+            self.breaker.record_failure()
+        else:
+            # Запрос не дошёл до провайдера: освобождаем пробный слот half-open без смены состояния
+            self.breaker.release()
+
+    async def aclose(self):
+        await self._client.aclose()
@@ -0,0 +1,94 @@
+import asyncio
+import logging
+import time
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+# Популярность ключей кэша считается по часам (forecast_popularity:YYYYMMDDHH, истекают сами),
+# POPULARITY_KEY — объединение часов за окно, пересчитывается при ранжировании
+POPULARITY_KEY = "forecast_popularity"
+POPULARITY_BUCKET_PREFIX = "forecast_popularity:"
+POPULARITY_WINDOW_HOURS = 24
+LEADER_KEY = "refresh_ahead:leader"
+
+
+def popularity_bucket(timestamp):
+    return POPULARITY_BUCKET_PREFIX + time.strftime("%Y%m%d%H", time.gmtime(timestamp))
+
+
+def record_popularity(pipe, cache_keys, now, window_hours, max_tracked):
+    # Команды добавляются в переданный pipeline запроса. Размер часа ограничен max_tracked
+    # ключами, запросы старше window_hours перестают учитываться
+    bucket = popularity_bucket(now)
+    for cache_key in cache_keys:
+        pipe.zincrby(bucket, 1, cache_key)
+    pipe.zremrangebyrank(bucket, 0, -max_tracked - 1)
+    pipe.expire(bucket, window_hours * 3600)
+
+
+async def top_popular(redis_client, limit, now, window_hours=POPULARITY_WINDOW_HOURS):
+    # limit=0 — все ключи за окно
+    buckets = [popularity_bucket(now - 3600 * i) for i in range(window_hours)]
+    async with redis_client.pipeline(transaction=False) as pipe:
+        pipe.zunionstore(POPULARITY_KEY, buckets)
+        pipe.expire(POPULARITY_KEY, 3600)
+        pipe.zrevrange(POPULARITY_KEY, 0, limit - 1 if limit else -1)
+        _, _, cache_keys = await pipe.execute()
+    return cache_keys
+
+
+def split_cache_key(cache_key):
+    # provider:{city}:{lang} -> (city, lang)
+    _, rest = cache_key.split(":", 1)
+    city, lang = rest.rsplit(":", 1)
+    return city, lang
+
+
+def is_city_id_key(cache_key):
+    # Ключ по id провайдера. Ключи по нормализованному названию (город вне справочника до того,
+    # как стал известен его id) не обновляются: провайдер по такому названию город часто не находит,
+    # а запросы к этому городу уже идут под ключом по id
+    return split_cache_key(cache_key)[0].isdigit()
+
+
+class RefreshAheadScheduler:
+    # Держит самые запрашиваемые города тёплыми: раз в interval секунд берёт top_n
+    # самых популярных ключей (get_popular) и обновляет те, у которых скоро истечёт мягкий TTL.
+    # Между репликами тик выполняет только одна — та, что взяла LEADER_KEY.
+
+    def __init__(self, redis_client, refresh, get_fetched_at, get_popular, top_n, interval, soft_ttl, margin):
+        self.redis_client = redis_client
+        self.refresh = refresh
+        self.get_fetched_at = get_fetched_at
+        self.get_popular = get_popular
+        self.top_n = top_n
+        self.interval = interval
+        self.soft_ttl = soft_ttl
+        self.margin = margin
+
+    async def run(self):
+        logger.info(f"Refresh-ahead scheduler started: top_n={self.top_n}, interval={self.interval}s")
+        while True:
+            try:
+                await self.tick()
+            except redis.exceptions.ConnectionError as e:
+                logger.warning(f"Refresh-ahead tick skipped, Redis unavailable: {e}")
+            except Exception as e:
+                logger.error(f"Refresh-ahead tick failed: {e}", exc_info=True)
+            await asyncio.sleep(self.interval)
+
+    async def tick(self):
+        if not await self.redis_client.set(LEADER_KEY, "1", nx=True, ex=max(1, int(self.interval))):
+            return
+        cache_keys = [key for key in await self.get_popular(self.top_n) if is_city_id_key(key)]
+        if not cache_keys:
+            return
+
+        fetched_at = await self.get_fetched_at(cache_keys)
+        deadline = time.time() - self.soft_ttl + self.margin
+        due = [key for key, ts in zip(cache_keys, fetched_at) if ts is None or ts <= deadline]
+        if due:
+            logger.info(f"Refresh-ahead: refreshing {len(due)} of {len(cache_keys)} hot keys")
+            await asyncio.gather(*[self.refresh(*split_cache_key(key), key) for key in due])
@@ -0,0 +1,158 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+
+import redis
+
+from metrics import circuit_state, quota_limit, quota_used, rate_limited
+
+logger = logging.getLogger(__name__)
+
+# Токен-бакет, дневная квота и пауза после 429 в одном скрипте: один round trip на вызов.
+# Возвращает {status, wait_ms, used}: status 1 — можно идти к провайдеру,
+# 0 — подождать wait_ms, -1 — дневная квота исчерпана.
+ACQUIRE_SCRIPT = """
+if redis.replicate_commands then redis.replicate_commands() end
+local backoff = redis.call("PTTL", KEYS[3])
+if backoff > 0 then
+    return {0, backoff, -1}
+end
+local t = redis.call("TIME")
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local state = redis.call("HMGET", KEYS[1], "tokens", "ts")
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate / 1000)
+if tokens < 1 then
+    return {0, math.ceil((1 - tokens) * 1000 / rate), -1}
+end
+local limit = tonumber(ARGV[3])
+local used = tonumber(redis.call("GET", KEYS[2]) or "0")
+if limit > 0 and used >= limit then
+    return {-1, 0, used}
+end
+redis.call("HSET", KEYS[1], "tokens", tostring(tokens - 1), "ts", tostring(now))
+redis.call("PEXPIRE", KEYS[1], math.ceil(capacity * 1000 / rate) + 1000)
+used = redis.call("INCR", KEYS[2])
+if used == 1 then
+    redis.call("EXPIRE", KEYS[2], ARGV[4])
+end
+return {1, 0, used}
+"""
+
+
+class RateLimitedError(Exception):
+    def __init__(self, message, retry_after=0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class QuotaExceededError(RateLimitedError):
+    pass
+
+
+class RateLimiter:
+    # Общий для всех реплик лимит запросов к провайдеру (токен-бакет в Redis) и дневная квота.
+    # При недоступности Redis лимит не применяется, чтобы не останавливать сервис.
+
+    def __init__(self, redis_client, name, rate, capacity, daily_quota=0, max_wait=2.0):
+        self.redis_client = redis_client
+        self.name = name
+        self.rate = rate
+        self.capacity = capacity
+        self.daily_quota = daily_quota
+        self.max_wait = max_wait
+        quota_limit.set(daily_quota)
+
+    def _keys(self):
+        day = datetime.now(timezone.utc).strftime("%Y%m%d")
+        return [f"ratelimit:{self.name}", f"quota:{self.name}:{day}", f"ratelimit:{self.name}:backoff"]
+
+    async def acquire(self):
+        deadline = time.monotonic() + self.max_wait
+        while True:
+            try:
+                status, wait_ms, used = await self.redis_client.eval(
+                    ACQUIRE_SCRIPT, 3, *self._keys(), self.rate, self.capacity, self.daily_quota, 2 * 86400
+                )
+            except redis.exceptions.RedisError as e:
+                logger.warning(f"Rate limiter unavailable: {e}. Allowing request.")
+                return
+            if status == 1:
+                quota_used.set(used)
+                return
+            if status == -1:
+                rate_limited.labels(reason="quota").inc()
+                now = datetime.now(timezone.utc)
+                until_midnight = 86400 - (now.hour * 3600 + now.minute * 60 + now.second)
+                raise QuotaExceededError(f"Daily quota of {self.daily_quota} calls is exhausted", until_midnight)
+            if time.monotonic() + wait_ms / 1000 > deadline:
+                rate_limited.labels(reason="rate").inc()
+                raise RateLimitedError(f"Rate limit wait of {wait_ms}ms exceeds {self.max_wait}s", wait_ms / 1000)
+            await asyncio.sleep(wait_ms / 1000)
+
+    async def pause(self, seconds):
+        # Провайдер ответил 429: все реплики делают паузу (Retry-After или seconds)
+        try:
+            await self.redis_client.set(self._keys()[2], "1", px=max(1, int(seconds * 1000)))
+        except redis.exceptions.RedisError as e:
+            logger.warning(f"Could not store provider backoff: {e}")
+
+
+class CircuitBreaker:
+    # closed -> open после failure_threshold ошибок подряд; через reset_timeout секунд
+    # half-open пропускает один пробный запрос: успех закрывает цепь, ошибка снова открывает.
+    CLOSED, HALF_OPEN, OPEN = 0, 1, 2
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._set_state(self.CLOSED)
+
+    def _set_state(self, state):
+        self.state = state
+        circuit_state.set(state)
+
+    def retry_after(self):
+        if self.opened_at is None:
+            return 0
+        return max(0.0, self.reset_timeout - (self.clock() - self.opened_at))
+
+    def allow(self):
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN and self.retry_after() == 0:
+            self._set_state(self.HALF_OPEN)
+            self._trial_in_flight = False
+        if self.state == self.HALF_OPEN and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return True
+        return False
+
+    def release(self):
+        # Пробный запрос так и не ушёл к провайдеру (например, упёрся в лимит)
+        self._trial_in_flight = False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        if self.state != self.CLOSED:
+            logger.info("Circuit breaker closed: provider recovered")
+            self._set_state(self.CLOSED)
+
+    def record_failure(self):
+        self.failures += 1
+        self._trial_in_flight = False
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                logger.warning(f"Circuit breaker opened after {self.failures} failures")
+            self.opened_at = self.clock()
+            self._set_state(self.OPEN)
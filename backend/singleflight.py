@@ -0,0 +1,61 @@
+import asyncio
+import logging
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Снимает блокировку, только если она всё ещё принадлежит нам
+RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+class SingleFlight:
+    # Объединяет одновременные вызовы с одним ключом: функция выполняется один раз,
+    # остальные вызывающие ждут и получают тот же результат (или то же исключение).
+
+    def __init__(self):
+        self._calls = {}
+
+    def __len__(self):
+        return len(self._calls)
+
+    def __contains__(self, key):
+        return key in self._calls
+
+    async def do(self, key, fn):
+        # Возвращает (result, leader): leader=True только у вызова, который выполнил fn
+        task = self._calls.get(key)
+        leader = task is None
+        if leader:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+        # shield: отмена одного ожидающего не отменяет общий запрос
+        return await asyncio.shield(task), leader
+
+    def _forget(self, key, task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            # помечаем исключение как полученное, даже если все ожидающие отменены
+            task.exception()
+
+
+class RedisLock:
+    # Короткоживущая блокировка SET NX PX для объединения запросов между репликами
+
+    def __init__(self, redis_client, key, ttl_ms):
+        self.redis_client = redis_client
+        self.key = key
+        self.ttl_ms = ttl_ms
+        self.token = uuid.uuid4().hex
+
+    async def acquire(self):
+        return bool(await self.redis_client.set(self.key, self.token, nx=True, px=self.ttl_ms))
+
+    async def release(self):
+        await self.redis_client.eval(RELEASE_LOCK_SCRIPT, 1, self.key, self.token)
@@ -0,0 +1,43 @@
+import os
+import sys
+from datetime import datetime, timezone
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from aggregation import aggregate_daily
+from forecast_model import ForecastSeries
+
+
+def item(dt_txt, temp, description, icon="01d", with_dt=True):
+    entry = {"dt_txt": dt_txt, "temp": temp, "description": description, "icon": icon}
+    if with_dt:
+        moment = datetime.strptime(dt_txt, "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc)
+        entry["dt"] = int(moment.timestamp())
+    return entry
+
+
+ITEMS = [
+    item("2025-04-13 09:00:00", 4.0, "rain", "10d"),
+    item("2025-04-13 12:00:00", 7.0, "clouds", "04d"),
+    item("2025-04-13 15:00:00", 6.0, "rain", "10d"),
+    item("2025-04-14 00:00:00", -1.0, "clear", "01n"),
+    item("2025-04-14 03:00:00", -2.5, "clear", "01n"),
+]
+
+
+def test_one_entry_per_day_with_noon_pick_and_daily_stats():
+    daily = aggregate_daily(ForecastSeries.from_items(ITEMS))
+    assert [d["date"] for d in daily] == ["2025-04-13 12:00:00", "2025-04-14 03:00:00"]
+    assert daily[0]["dt"] == ITEMS[1]["dt"]
+    first = daily[0]
+    assert (first["temperature"], first["description"], first["icon"]) == (7.0, "clouds", "04d")
+    assert (first["temp_min"], first["temp_max"], first["temp_avg"]) == (4.0, 7.0, 5.67)
+    assert first["dominant_description"] == "rain"
+    assert (daily[1]["temp_min"], daily[1]["temp_max"]) == (-2.5, -1.0)
+
+
+def test_items_without_numeric_dt_fall_back_to_dt_txt():
+    legacy = [dict(i) for i in ITEMS]
+    for i in legacy:
+        del i["dt"]
+    assert ForecastSeries.from_items(legacy) == ForecastSeries.from_items(ITEMS)
@@ -0,0 +1,47 @@
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import pytest
+
+import codec
+from forecast_model import ForecastSeries
+
+
+def test_round_trip_uses_versioned_format():
+    entry = {"city": "Москва", "avg_temperature": 12.5, "description": "ясно", "icon": "01d"}
+    encoded = codec.encode(entry)
+    assert encoded.startswith(codec.FORMAT_PREFIX)
+    assert codec.decode(encoded) == entry
+
+
+def test_legacy_str_dict_is_still_readable():
+    entry = {"city": "Moscow", "forecast": [{"temperature": 3.1}], "country": "RU"}
+    assert codec.decode(str(entry)) == entry
+
+
+@pytest.mark.parametrize("raw", ["v1:{broken", "not a dict at all("])
+def test_invalid_payload_raises_codec_error(raw):
+    with pytest.raises(codec.CodecError):
+        codec.decode(raw)
+
+
+def test_forecast_v2_round_trip_and_v1_list_migration():
+    items = [
+        {"dt": 1744545600, "dt_txt": "2025-04-13 12:00:00", "temp": 7.0, "description": "ясно", "icon": "01d"},
+        {"dt": 1744556400, "dt_txt": "2025-04-13 15:00:00", "temp": 6.5, "description": "ясно", "icon": "01d"},
+    ]
+    payload = codec.decode_forecast(codec.encode({"city": "Москва", "country": "RU", "list": items}))
+    assert "list" not in payload
+    assert payload["series"] == ForecastSeries.from_items(items)
+
+    encoded = codec.encode_forecast(payload)
+    assert encoded.startswith(codec.FORECAST_PREFIX)
+    assert codec.decode_forecast(encoded) == payload
+
+
+@pytest.mark.parametrize("raw", ["v2:{\"city\": \"x\"}", "v1:{\"city\": \"x\"}"])
+def test_forecast_without_series_raises_codec_error(raw):
+    with pytest.raises(codec.CodecError):
+        codec.decode_forecast(raw)
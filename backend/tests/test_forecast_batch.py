@@ -0,0 +1,196 @@
+import asyncio
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import pytest
+from fastapi.testclient import TestClient
+
+import codec
+import main
+from benchmarks.stub_provider import city_id, make_forecast_payload
+from geocode import CityIndex
+from provider import CityNotFoundError, ProviderUnavailableError
+from refresh import POPULARITY_BUCKET_PREFIX
+from updates import UpdateHub
+
+
+class FakeRedis:
+    # Значения в словаре; команды записи (SETEX, XADD, ZINCRBY...) только записываются в calls
+    def __init__(self, values=None):
+        self.values = dict(values or {})
+        self.calls = []
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    async def mget(self, keys):
+        self.calls.append(("mget", list(keys)))
+        return [self.values.get(key) for key in keys]
+
+    async def pttl(self, key):
+        return 600000 if key in self.values else -2
+
+    async def hmget(self, key, fields):
+        return [None] * len(fields)
+
+    async def hset(self, key, mapping):
+        self.calls.append(("hset", (key, mapping)))
+
+    def __getattr__(self, name):
+        async def command(*args, **kwargs):
+            self.calls.append((name, args))
+        return command
+
+
+class FakePipeline:
+    def __init__(self, redis_client):
+        self.redis_client = redis_client
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.commands.append((name, args, kwargs))
+
+    async def execute(self):
+        return [await getattr(self.redis_client, name)(*args, **kwargs) for name, args, kwargs in self.commands]
+
+
+class FakeProvider:
+    def __init__(self, errors=None):
+        self.errors = errors or {}
+        self.calls = []
+
+    async def fetch_forecast(self, city, lang):
+        self.calls.append(city)
+        if city in self.errors:
+            raise self.errors[city]
+        return make_forecast_payload(city.title())
+
+
+def popular_keys(redis_client):
+    # Ключи, учтённые в часовых корзинах популярности
+    return [args[2] for name, args in redis_client.calls
+            if name == "zincrby" and args[0].startswith(POPULARITY_BUCKET_PREFIX)]
+
+
+def cached(city):
+    payload = main.compact_provider_payload(make_forecast_payload(city), city)
+    payload["fetched_at"] = main.time.time()
+    return payload
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    redis_client = FakeRedis()
+    provider = FakeProvider()
+    monkeypatch.setattr(main, "redis_client", redis_client)
+    monkeypatch.setattr(main, "provider_client", provider)
+    monkeypatch.setattr(main, "SINGLEFLIGHT_REDIS_LOCK", False)
+    monkeypatch.setattr(main, "city_index", CityIndex())
+    main.local_cache.clear()
+    yield redis_client, provider
+    main.local_cache.clear()
+
+
+def test_batch_dedups_queries_and_splits_local_tier_mget_and_provider(backend):
+    redis_client, provider = backend
+    moscow = cached("Moscow")
+    main.local_cache.set("provider:moscow:en", moscow, 1000, 30)
+    redis_client.values["provider:london:en"] = codec.encode_forecast(cached("London"))
+
+    response = TestClient(main.app).get(
+        "/forecast/batch", params={"cities": "Moscow, London,Paris,Moscow,,London", "days": 2}
+    )
+
+    assert response.status_code == 200
+    body = response.json()
+    assert [(r["query"], r["fromCache"], len(r["forecast"])) for r in body["results"]] == [
+        ("Moscow", True, 2), ("London", True, 2), ("Paris", False, 2),
+    ]
+    assert body["errors"] == []
+    # Москва — из локального кэша, в Redis одним MGET идут только London и Paris
+    assert [call for call in redis_client.calls if call[0] == "mget"] == [
+        ("mget", ["provider:london:en", "provider:paris:en"])
+    ]
+    assert provider.calls == ["Paris"]
+    written = [args[0] for name, args in redis_client.calls if name == "setex"]
+    assert "provider:paris:en" in written
+    assert popular_keys(redis_client) == [
+        "provider:moscow:en", "provider:london:en", f"provider:{city_id('Paris')}:en",
+    ]
+
+
+def test_batch_reports_per_city_errors(backend):
+    _, provider = backend
+    provider.errors = {
+        "UnknownX": CityNotFoundError("not found"),
+        "Downtown": ProviderUnavailableError("circuit open", retry_after=30),
+    }
+
+    response = TestClient(main.app).get("/forecast/batch", params={"cities": "UnknownX,Downtown,Paris"})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert [r["query"] for r in body["results"]] == ["Paris"]
+    assert [(e["query"], e["status"]) for e in body["errors"]] == [("UnknownX", 404), ("Downtown", 503)]
+    assert body["errors"][0]["detail"] == "City 'UnknownX' not found by OpenWeatherMap"
+
+
+def test_unknown_city_is_sent_to_provider_as_typed_and_cached_under_normalized_name(backend):
+    redis_client, provider = backend
+    provider.errors = {"Йошкар-Ола": CityNotFoundError("not found")}
+    client = TestClient(main.app)
+
+    response = client.get("/forecast/%20Kraków%20")
+    assert response.status_code == 200
+    assert provider.calls == ["Kraków"]
+    written = [args[0] for name, args in redis_client.calls if name == "setex"]
+    assert written == ["provider:krakow:en", f"provider:{city_id('Kraków')}:en"]
+    assert ("hset", (main.CITY_ALIAS_KEY, {"krakow": city_id("Kraków")})) in redis_client.calls
+    # Популярность — под ключом по id: ключ по названию больше никто не читает
+    assert popular_keys(redis_client) == [f"provider:{city_id('Kraków')}:en"]
+
+    response = client.get("/forecast/Йошкар-Ола")
+    assert response.status_code == 404
+    assert provider.calls[-1] == "Йошкар-Ола"
+    assert response.json()["detail"] == "City 'Йошкар-Ола' not found by OpenWeatherMap"
+
+
+def test_batch_rejects_empty_and_oversized_requests(backend, monkeypatch):
+    monkeypatch.setattr(main, "BATCH_MAX_CITIES", 2)
+    client = TestClient(main.app)
+    assert client.get("/forecast/batch", params={"cities": " , "}).status_code == 400
+    assert client.get("/forecast/batch", params={"cities": "a,b,c"}).status_code == 400
+    # Повторы не считаются
+    assert client.get("/forecast/batch", params={"cities": "Paris,Paris,Rome"}).status_code == 200
+
+
+def test_stream_miss_learns_city_id(backend, monkeypatch):
+    redis_client, provider = backend
+    monkeypatch.setattr(main, "update_hub", UpdateHub(redis_client))
+    monkeypatch.setattr(main, "SSE_KEEPALIVE", 0.01)
+
+    async def first_chunk():
+        response = await main.stream_forecasts("Atlantis")
+        events = response.body_iterator
+        try:
+            # Прогноз придёт событием из очереди после записи в кэш; здесь её никто не публикует
+            return await events.__anext__()
+        finally:
+            await events.aclose()
+
+    assert asyncio.run(first_chunk()) == ": keepalive\n\n"
+    assert provider.calls == ["Atlantis"]
+    written = [args[0] for name, args in redis_client.calls if name == "setex"]
+    assert written == ["provider:atlantis:en", f"provider:{city_id('Atlantis')}:en"]
+    assert ("hset", (main.CITY_ALIAS_KEY, {"atlantis": city_id("Atlantis")})) in redis_client.calls
+    assert popular_keys(redis_client) == [f"provider:{city_id('Atlantis')}:en"]
+    # Следующий запрос идёт к провайдеру уже по id
+    assert asyncio.run(main.resolve_cities(["Atlantis"])) == {"Atlantis": str(city_id("Atlantis"))}
@@ -0,0 +1,42 @@
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from forecast_model import ForecastSeries, compact_forecast
+
+START = 1744545600  # 2025-04-13 12:00:00 UTC
+
+
+def test_columns_round_trip_with_regular_step_and_shared_strings():
+    series = ForecastSeries(
+        [START, START + 10800, START + 21600], [7.0, 6.5, 4.25], ["rain", "rain", "clouds"], ["10d", "10d", "04d"]
+    )
+    columns = series.to_columns()
+    assert (columns["dt0"], columns["step"]) == (START, 10800)
+    assert "dt" not in columns
+    assert columns["strings"] == ["rain", "clouds", "10d", "04d"]
+    assert columns["description"] == [0, 0, 1]
+    assert ForecastSeries.from_columns(columns) == series
+
+
+def test_irregular_timestamps_are_stored_in_full():
+    series = ForecastSeries([START, START + 10800, START + 32400], [1.0, 2.0, 3.0], ["a", "a", "a"], ["01d"] * 3)
+    columns = series.to_columns()
+    assert columns["dt"] == [START, START + 10800, START + 32400]
+    assert ForecastSeries.from_columns(columns) == series
+
+
+def test_compact_forecast_indexes_strings_across_fields():
+    daily = [
+        {"dt": START, "temperature": 7.0, "temp_min": 4.0, "temp_max": 7.0, "temp_avg": 5.67,
+         "description": "clouds", "dominant_description": "rain", "icon": "04d"},
+        {"dt": START + 86400, "temperature": -1.0, "temp_min": -2.5, "temp_max": -1.0, "temp_avg": -1.75,
+         "description": "rain", "dominant_description": "rain", "icon": "10d"},
+    ]
+    compact = compact_forecast(daily)
+    assert compact["dt"] == [START, START + 86400]
+    assert compact["strings"] == ["clouds", "rain", "04d", "10d"]
+    assert compact["description"] == [0, 1]
+    assert compact["dominant_description"] == [1, 1]
+    assert compact["icon"] == [2, 3]
@@ -0,0 +1,53 @@
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from geocode import CityIndex, normalize_name
+
+BUNDLED_CITIES = os.path.join(os.path.dirname(__file__), "..", "data", "cities.json")
+
+
+def make_index():
+    index = CityIndex()
+    index.add_entries([
+        {"id": 4400, "name": "Moscow", "country": "US", "population": 25000},
+        {"id": 524901, "name": "Moscow", "country": "RU", "population": 10381222, "aliases": ["Москва"]},
+        {"id": 2643743, "name": "London", "country": "GB", "aliases": ["Лондон"]},
+        {"id": 6058560, "name": "London", "country": "CA"},
+    ])
+    return index
+
+
+def test_normalize_name_ignores_case_spacing_and_diacritics():
+    assert normalize_name("  São   Paulo ") == "sao paulo"
+    assert normalize_name("Нью-Йорк") == normalize_name("нью йорк")
+    assert normalize_name("Ёлки") == "елки"
+
+
+def test_resolve_prefers_larger_city_and_honours_country():
+    index = make_index()
+    assert index.resolve(" MOSCOW ") == 524901
+    assert index.resolve("москва") == 524901
+    assert index.resolve("Moscow,US") == 4400
+    assert index.resolve("London") == 2643743
+    assert index.resolve("london, ca") == 6058560
+    assert index.resolve("Atlantis") is None
+
+    index.remember("atlantis", "42")
+    assert index.resolve("Atlantis") == 42
+
+
+def test_autocomplete_puts_exact_matches_and_big_cities_first():
+    index = make_index()
+    assert [c["id"] for c in index.autocomplete("mos")] == [524901, 4400]
+    assert [c["id"] for c in index.autocomplete("Лон")] == [2643743]
+    assert [c["name"] for c in index.autocomplete("lo", limit=1)] == ["London"]
+    assert index.autocomplete("  ") == []
+
+
+def test_bundled_city_list_loads():
+    index = CityIndex()
+    index.load(BUNDLED_CITIES)
+    assert index.resolve("Москва") == 524901
+    assert index.resolve("London") == 2643743
@@ -0,0 +1,44 @@
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import history
+
+NOW = 1700000000.0
+
+
+class RecordingPipeline:
+    def __init__(self):
+        self.calls = []
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.calls.append((name, args, kwargs))
+
+
+def test_add_entries_updates_stream_and_hourly_aggregates():
+    pipe = RecordingPipeline()
+    entry = {"city": "Moscow", "forecast_date": "2023-11-14", "avg_temperature": -3.5,
+             "description": "snow", "icon": "13d", "request_time": "ignored"}
+    history.add_entries(pipe, [entry], NOW, retention=3600, bucket_ttl=7200)
+
+    bucket = history.hour_bucket(NOW)
+    assert bucket == "2023111422"
+    names = [name for name, _, _ in pipe.calls]
+    assert names == ["xadd", "zincrby", "hincrby", "hincrbyfloat", "expire", "expire"]
+
+    _, (stream, fields), kwargs = pipe.calls[0]
+    assert stream == history.HISTORY_STREAM_KEY
+    assert "request_time" not in fields
+    assert kwargs["minid"] == int((NOW - 3600) * 1000)
+    assert pipe.calls[1][1] == (history.TOP_KEY_PREFIX + bucket, 1, "Moscow")
+    assert pipe.calls[3][1] == (history.STATS_KEY_PREFIX + bucket, "Moscow|t", -3.5)
+
+
+def test_parse_entry_takes_request_time_from_stream_id():
+    entry = history.parse_entry(
+        "1700000000123-0",
+        {"city": "Moscow", "forecast_date": "2023-11-14", "avg_temperature": "-3.5", "description": "snow", "icon": "13d"},
+    )
+    assert entry["avg_temperature"] == -3.5
+    assert entry["request_time"] == "2023-11-14T22:13:20.123Z"
@@ -0,0 +1,51 @@
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from fastapi import FastAPI, Request, Response
+from fastapi.testclient import TestClient
+
+from http_cache import apply_cache_headers, etag_matches, http_date, make_etag
+
+FETCHED_AT = 1700000000
+
+
+def make_client():
+    app = FastAPI()
+
+    @app.get("/item")
+    async def item(request: Request, response: Response):
+        not_modified = apply_cache_headers(
+            request, response, etag=make_etag("provider:moscow:en", FETCHED_AT, None),
+            last_modified=FETCHED_AT, cache_control="public, max-age=60",
+        )
+        return not_modified or {"city": "Moscow"}
+
+    return TestClient(app)
+
+
+def test_etag_matching_is_weak_and_accepts_lists():
+    etag = make_etag("provider:moscow:en", FETCHED_AT, 3)
+    assert etag.startswith('W/"')
+    assert etag_matches(etag, etag)
+    assert etag_matches(f'"other", {etag[2:]}', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches('"other"', etag)
+    assert etag != make_etag("provider:moscow:en", FETCHED_AT, 5)
+
+
+def test_conditional_get_returns_304_without_body():
+    client = make_client()
+    first = client.get("/item")
+    assert first.status_code == 200
+    assert first.headers["cache-control"] == "public, max-age=60"
+    assert first.headers["last-modified"] == http_date(FETCHED_AT)
+
+    revalidated = client.get("/item", headers={"If-None-Match": first.headers["etag"]})
+    assert revalidated.status_code == 304
+    assert revalidated.content == b""
+    assert revalidated.headers["etag"] == first.headers["etag"]
+
+    assert client.get("/item", headers={"If-Modified-Since": http_date(FETCHED_AT)}).status_code == 304
+    assert client.get("/item", headers={"If-None-Match": '"stale"'}).status_code == 200
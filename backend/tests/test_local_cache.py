@@ -0,0 +1,45 @@
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from local_cache import LocalCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_entry_expires_after_ttl():
+    clock = FakeClock()
+    evictions = []
+    cache = LocalCache(clock=clock, on_evict=evictions.append)
+    cache.set("provider:moscow:en", {"city": "Moscow"}, 100, ttl=30)
+    assert cache.get("provider:moscow:en") == {"city": "Moscow"}
+    clock.now = 31
+    assert cache.get("provider:moscow:en") is None
+    assert evictions == ["expired"]
+    assert cache.total_bytes == 0
+
+
+def test_least_recently_used_is_evicted_by_count_and_bytes():
+    evictions = []
+    cache = LocalCache(max_items=2, max_bytes=250, on_evict=evictions.append)
+    cache.set("a", 1, 100, ttl=60)
+    cache.set("b", 2, 100, ttl=60)
+    cache.get("a")
+    cache.set("c", 3, 100, ttl=60)
+    assert "b" not in cache and "a" in cache and "c" in cache
+    cache.set("d", 4, 200, ttl=60)
+    assert len(cache) == 1 and cache.get("d") == 4
+    assert evictions == ["size", "size", "size"]
+
+
+def test_oversized_value_is_not_stored():
+    cache = LocalCache(max_bytes=10)
+    cache.set("a", 1, 11, ttl=60)
+    assert cache.get("a") is None
@@ -11,6 +11,69 @@ client = TestClient(app)
 
 def test_get_forecast(mocker):
     mocker.patch("os.getenv", return_value="dummy-api-key")
-    response = client.get("/forecast/Moscow?lang=ru")
+    # Подключения к Redis и провайдеру создаются в lifespan приложения
+    with client:
+        response = client.get("/forecast/Moscow?lang=ru")
     assert response.status_code == 200
-    assert "city" in response.json()
\ No newline at end of file
+    assert "city" in response.json()
+
+def test_keyspace_flags_are_merged_with_server_config():
+    from main import merge_keyspace_flags
+
+    assert merge_keyspace_flags("") == "Kgxe"
+    assert merge_keyspace_flags("Ex") == "ExKge"
+    assert merge_keyspace_flags("KA") is None
+
+
+def test_is_stale_uses_soft_ttl_and_treats_missing_fetched_at_as_fresh(monkeypatch):
+    import time
+    import main
+
+    monkeypatch.setattr(main, "CACHE_SOFT_TTL", 600)
+    assert main.is_stale({"fetched_at": time.time() - 601})
+    assert not main.is_stale({"fetched_at": time.time() - 10})
+    assert not main.is_stale({})
+
+
+def test_concurrent_stale_hits_start_one_background_refresh(monkeypatch):
+    import asyncio
+    import main
+
+    calls = []
+
+    async def refresh_forecast(city, lang, cache_key):
+        calls.append(cache_key)
+        await asyncio.sleep(0.05)
+
+    monkeypatch.setattr(main, "refresh_forecast", refresh_forecast)
+
+    async def scenario():
+        for _ in range(5):
+            main.refresh_in_background("524901", "ru", "provider:524901:ru")
+        await asyncio.gather(*main.background_tasks)
+        # После завершения обновления следующее устаревание запускает новое
+        main.refresh_in_background("524901", "ru", "provider:524901:ru")
+        await asyncio.gather(*main.background_tasks)
+
+    asyncio.run(scenario())
+    assert calls == ["provider:524901:ru", "provider:524901:ru"]
+
+
+def test_background_refresh_survives_redis_error_on_ttl_extend(monkeypatch):
+    import asyncio
+    import main
+    import redis
+    from fastapi import HTTPException
+
+    async def fetch_from_provider(city, lang):
+        raise HTTPException(status_code=503, detail="Weather provider is temporarily unavailable")
+
+    class DownRedis:
+        async def expire(self, *args, **kwargs):
+            raise redis.exceptions.ConnectionError("Connection refused")
+
+    monkeypatch.setattr(main, "fetch_from_provider", fetch_from_provider)
+    monkeypatch.setattr(main, "redis_client", DownRedis())
+    monkeypatch.setattr(main, "SINGLEFLIGHT_REDIS_LOCK", False)
+    # Ошибка Redis при продлении TTL не выходит из фоновой задачи
+    asyncio.run(main.refresh_forecast("524901", "ru", "provider:524901:ru"))
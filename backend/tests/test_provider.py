@@ -0,0 +1,129 @@
+import asyncio
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import httpx
+import pytest
+
+import provider
+from provider import CityNotFoundError, ProviderClient, ProviderError, ProviderRequestError, ProviderUnavailableError
+from resilience import RateLimitedError
+
+
+class RecordingBreaker:
+    def __init__(self):
+        self.outcomes = []
+
+    def allow(self):
+        return True
+
+    def record_success(self):
+        self.outcomes.append("success")
+
+    def record_failure(self):
+        self.outcomes.append("failure")
+
+    def release(self):
+        self.outcomes.append("release")
+
+    def retry_after(self):
+        return 0
+
+
+class RecordingLimiter:
+    def __init__(self, error=None):
+        self.error = error
+        self.pauses = []
+
+    async def acquire(self):
+        if self.error is not None:
+            raise self.error
+
+    async def pause(self, seconds):
+        self.pauses.append(seconds)
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(provider, "OPENWEATHER_RETRY_BACKOFF", 0)
+    monkeypatch.setattr(provider, "OPENWEATHER_RETRIES", 2)
+
+
+def fetch(responses, limiter=None, city="Moscow"):
+    # responses — по одному на попытку: httpx.Response или исключение транспорта
+    requests = []
+    breaker = RecordingBreaker()
+
+    def handler(request):
+        requests.append(request)
+        outcome = responses[len(requests) - 1]
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    async def scenario():
+        client = ProviderClient("key", base_url="http://owm.test", transport=httpx.MockTransport(handler),
+                                rate_limiter=limiter, breaker=breaker)
+        try:
+            return await client.fetch_forecast(city, "ru")
+        finally:
+            await client.aclose()
+
+    try:
+        return asyncio.run(scenario()), requests, breaker
+    except ProviderError as e:
+        return e, requests, breaker
+
+
+def test_5xx_and_network_errors_are_retried_until_success():
+    result, requests, breaker = fetch([
+        httpx.Response(502),
+        httpx.ConnectError("connection refused"),
+        httpx.Response(200, json={"list": []}),
+    ])
+    assert result == {"list": []}
+    assert len(requests) == 3
+    assert breaker.outcomes == ["success"]
+
+
+def test_exhausted_retries_count_one_breaker_failure():
+    result, requests, breaker = fetch([httpx.Response(500)] * 3)
+    assert type(result) is ProviderError
+    assert len(requests) == 3
+    assert breaker.outcomes == ["failure"]
+
+
+def test_404_is_not_retried_and_counts_as_success():
+    result, requests, breaker = fetch([httpx.Response(404)], city="524901")
+    assert isinstance(result, CityNotFoundError)
+    assert len(requests) == 1
+    assert requests[0].url.params["id"] == "524901"
+    assert breaker.outcomes == ["success"]
+
+
+def test_other_4xx_is_not_retried():
+    result, requests, breaker = fetch([httpx.Response(401)])
+    assert isinstance(result, ProviderRequestError)
+    assert len(requests) == 1
+    assert breaker.outcomes == ["failure"]
+
+
+def test_429_pauses_limiter_with_retry_after_and_retries():
+    limiter = RecordingLimiter()
+    result, requests, _ = fetch(
+        [httpx.Response(429, headers={"Retry-After": "7"}), httpx.Response(200, json={"list": [1]})], limiter
+    )
+    assert result == {"list": [1]}
+    assert len(requests) == 2
+    assert limiter.pauses == [7.0]
+
+
+def test_rate_limited_call_releases_breaker_without_request():
+    limiter = RecordingLimiter(RateLimitedError("rate limit", retry_after=3))
+    result, requests, breaker = fetch([], limiter)
+    assert isinstance(result, ProviderUnavailableError)
+    assert result.retry_after == 3
+    assert requests == []
+    assert breaker.outcomes == ["release"]
@@ -0,0 +1,88 @@
+import asyncio
+import os
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from refresh import (
+    LEADER_KEY, RefreshAheadScheduler, is_city_id_key, popularity_bucket, record_popularity, split_cache_key,
+)
+
+NOW = 1700000000.0
+
+
+class RecordingPipeline:
+    def __init__(self):
+        self.calls = []
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.calls.append((name, args, kwargs))
+
+
+class LeaderLock:
+    def __init__(self):
+        self.held = set()
+
+    async def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.held:
+            return None
+        self.held.add(key)
+        return True
+
+
+def test_popularity_is_counted_per_hour_with_cap_and_expiry():
+    pipe = RecordingPipeline()
+    record_popularity(pipe, ["provider:524901:ru", "provider:2643743:en"], NOW, window_hours=24, max_tracked=100)
+
+    bucket = popularity_bucket(NOW)
+    assert bucket == "forecast_popularity:2023111422"
+    assert pipe.calls == [
+        ("zincrby", (bucket, 1, "provider:524901:ru"), {}),
+        ("zincrby", (bucket, 1, "provider:2643743:en"), {}),
+        ("zremrangebyrank", (bucket, 0, -101), {}),
+        ("expire", (bucket, 24 * 3600), {}),
+    ]
+
+
+def test_split_cache_key_keeps_colons_in_city():
+    assert split_cache_key("provider:new york:en") == ("new york", "en")
+    assert split_cache_key("provider:a:b:ru") == ("a:b", "ru")
+
+
+def test_is_city_id_key():
+    assert is_city_id_key("provider:524901:ru")
+    assert not is_city_id_key("provider:иошкар ола:ru")
+
+
+def test_tick_refreshes_due_keys_only_on_leader():
+    now = time.time()
+    fetched_at = {
+        "provider:1:en": now, "provider:2:en": now - 3500, "provider:3:en": None,
+        # Ключ по названию провайдеру не отправляется
+        "provider:krakow:en": None,
+    }
+    refreshed = []
+
+    async def refresh(city, lang, cache_key):
+        refreshed.append(cache_key)
+
+    async def get_fetched_at(keys):
+        return [fetched_at[key] for key in keys]
+
+    async def get_popular(limit):
+        return list(fetched_at)[:limit]
+
+    lock = LeaderLock()
+    scheduler = RefreshAheadScheduler(
+        lock, refresh, get_fetched_at, get_popular, top_n=4, interval=60, soft_ttl=3600, margin=300
+    )
+
+    async def scenario():
+        await scheduler.tick()
+        # Вторая реплика в том же интервале не становится лидером
+        await scheduler.tick()
+
+    asyncio.run(scenario())
+    assert LEADER_KEY in lock.held
+    assert sorted(refreshed) == ["provider:2:en", "provider:3:en"]
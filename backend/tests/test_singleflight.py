@@ -0,0 +1,43 @@
+import asyncio
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from singleflight import SingleFlight
+
+
+def test_concurrent_calls_share_one_execution():
+    calls = 0
+
+    async def fetch():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return "forecast"
+
+    async def run():
+        flights = SingleFlight()
+        results = await asyncio.gather(*[flights.do("forecast:Moscow", fetch) for _ in range(10)])
+        assert len(flights) == 0
+        return results
+
+    results = asyncio.run(run())
+    assert calls == 1
+    assert [value for value, _ in results] == ["forecast"] * 10
+    assert sum(leader for _, leader in results) == 1
+
+
+def test_exception_is_shared_and_key_is_released():
+    async def failing():
+        await asyncio.sleep(0.01)
+        raise ValueError("provider down")
+
+    async def run():
+        flights = SingleFlight()
+        results = await asyncio.gather(*[flights.do("k", failing) for _ in range(3)], return_exceptions=True)
+        assert all(isinstance(r, ValueError) for r in results)
+        value, leader = await flights.do("k", lambda: asyncio.sleep(0, result="ok"))
+        assert (value, leader) == ("ok", True)
+
+    asyncio.run(run())
@@ -0,0 +1,39 @@
+import asyncio
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from updates import UpdateHub, updates_channel
+
+
+def test_dispatch_reaches_only_subscribers_of_the_key_until_unsubscribed():
+    async def scenario():
+        hub = UpdateHub(redis_client=None)
+        moscow = hub.subscribe(["provider:524901:ru"])
+        both = hub.subscribe(["provider:524901:ru", "provider:2643743:ru"])
+
+        hub.dispatch("provider:2643743:ru", "v1:{}")
+        assert moscow.empty()
+        assert both.get_nowait() == ("provider:2643743:ru", "v1:{}")
+
+        hub.unsubscribe(both, ["provider:524901:ru", "provider:2643743:ru"])
+        hub.dispatch("provider:524901:ru", "v1:{}")
+        assert both.empty()
+        assert moscow.qsize() == 1
+        hub.unsubscribe(moscow, ["provider:524901:ru"])
+        assert hub._subscribers == {}
+
+    asyncio.run(scenario())
+
+
+def test_slow_subscriber_loses_oldest_updates():
+    async def scenario():
+        hub = UpdateHub(redis_client=None, queue_size=2)
+        queue = hub.subscribe(["k"])
+        for i in range(4):
+            hub.dispatch("k", str(i))
+        assert [queue.get_nowait()[1] for _ in range(queue.qsize())] == ["2", "3"]
+
+    asyncio.run(scenario())
+    assert updates_channel("provider:524901:ru") == "forecast_updates:provider:524901:ru"
@@ -0,0 +1,39 @@
+import asyncio
+import os
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from warmup import CacheWarmer
+
+
+def test_prefetch_refreshes_only_missing_or_stale_keys_with_bounded_concurrency():
+    now = time.time()
+    # provider:atlantis:en — ключ по названию, провайдеру не отправляется
+    fetched_at = {"provider:524901:ru": now, "provider:2643743:ru": now - 7200, "provider:atlantis:en": None}
+    refreshed = []
+    running = 0
+    peak = 0
+
+    async def refresh(city, lang, cache_key):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        refreshed.append((city, lang, cache_key))
+        running -= 1
+
+    async def get_fetched_at(keys):
+        return [fetched_at.get(key) for key in keys]
+
+    async def get_popular(limit):
+        return (list(fetched_at) + ["provider:2988507:en"])[:limit]
+
+    warmer = CacheWarmer(
+        None, refresh, get_fetched_at, get_popular, top_n=4, concurrency=1, soft_ttl=3600, timeout=10
+    )
+    asyncio.run(warmer.prefetch())
+
+    assert sorted(refreshed) == [("2643743", "ru", "provider:2643743:ru"), ("2988507", "en", "provider:2988507:en")]
+    assert peak == 1
@@ -0,0 +1,61 @@
+import asyncio
+import logging
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+# Каждое обновление прогноза публикуется в канал forecast_updates:{ключ кэша}
+UPDATES_CHANNEL_PREFIX = "forecast_updates:"
+
+
+def updates_channel(cache_key):
+    return UPDATES_CHANNEL_PREFIX + cache_key
+
+
+class UpdateHub:
+    # Раздача обновлений прогнозов подписчикам воркера (SSE-соединениям).
+    # На воркер одна подписка PSUBSCRIBE в Redis, сообщения раскладываются по
+    # локальным очередям подписчиков этого ключа. Медленному подписчику, у которого
+    # очередь заполнена, отбрасывается самое старое обновление.
+
+    def __init__(self, redis_client, queue_size=16, retry_interval=1.0):
+        self.redis_client = redis_client
+        self.queue_size = queue_size
+        self.retry_interval = retry_interval
+        self._subscribers = {}
+
+    def subscribe(self, cache_keys, queue=None):
+        # Повторный вызов с той же очередью добавляет ей ключи
+        if queue is None:
+            queue = asyncio.Queue(self.queue_size)
+        for cache_key in cache_keys:
+            self._subscribers.setdefault(cache_key, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, queue, cache_keys):
+        for cache_key in cache_keys:
+            queues = self._subscribers.get(cache_key)
+            if queues is not None:
+                queues.discard(queue)
+                if not queues:
+                    del self._subscribers[cache_key]
+
+    def dispatch(self, cache_key, data):
+        for queue in self._subscribers.get(cache_key, ()):
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait((cache_key, data))
+
+    async def run(self):
+        while True:
+            try:
+                async with self.redis_client.pubsub() as pubsub:
+                    await pubsub.psubscribe(UPDATES_CHANNEL_PREFIX + "*")
+                    logger.info("Listening for forecast updates")
+                    async for message in pubsub.listen():
+                        if message["type"] == "pmessage":
+                            self.dispatch(message["channel"][len(UPDATES_CHANNEL_PREFIX):], message["data"])
+            except redis.exceptions.ConnectionError as e:
+                logger.warning(f"Forecast updates subscription lost: {e}. Retrying in {self.retry_interval}s")
+                await asyncio.sleep(self.retry_interval)
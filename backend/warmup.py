@@ -0,0 +1,174 @@
+# Прогрев кэша при старте и снимок кэша для переноса между окружениями.
+#
+# CacheWarmer берёт самые запрашиваемые ключи (get_popular) и запрашивает у провайдера
+# отсутствующие или устаревшие. Прогревает одна реплика (та, что взяла WARMUP_LOCK_KEY),
+# остальные ждут её завершения. Дальше горячие ключи обновляет RefreshAheadScheduler.
+#
+# Снимок — JSON Lines с записями provider:*, city_alias и популярностью за окно
+# (при импорте попадает в текущий час):
+#   cd backend && python warmup.py export snapshot.jsonl.gz
+#   python warmup.py import snapshot.jsonl.gz
+import argparse
+import asyncio
+import gzip
+import json
+import logging
+import os
+import time
+
+import redis
+
+from geocode import CITY_ALIAS_KEY
+from refresh import (
+    POPULARITY_KEY, POPULARITY_WINDOW_HOURS, is_city_id_key, popularity_bucket, split_cache_key, top_popular,
+)
+
+logger = logging.getLogger(__name__)
+
+WARMUP_LOCK_KEY = "warmup:lock"
+
+
+class CacheWarmer:
+    # done становится True после прогрева (или по таймауту) — по нему отвечает /health/ready
+
+    def __init__(self, redis_client, refresh, get_fetched_at, get_popular, top_n, concurrency, soft_ttl, timeout):
+        self.redis_client = redis_client
+        self.refresh = refresh
+        self.get_fetched_at = get_fetched_at
+        self.get_popular = get_popular
+        self.top_n = top_n
+        self.concurrency = concurrency
+        self.soft_ttl = soft_ttl
+        self.timeout = timeout
+        self.done = False
+
+    async def run(self, snapshot_path=None):
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(self._warm(snapshot_path), self.timeout)
+            logger.info(f"Cache warm-up finished in {time.monotonic() - started:.1f}s")
+        except asyncio.TimeoutError:
+            logger.warning(f"Cache warm-up did not finish in {self.timeout}s, serving anyway")
+        except redis.exceptions.ConnectionError as e:
+            logger.warning(f"Cache warm-up skipped, Redis unavailable: {e}")
+        finally:
+            self.done = True
+
+    async def _warm(self, snapshot_path):
+        if not await self.redis_client.set(WARMUP_LOCK_KEY, "1", nx=True, ex=max(1, int(self.timeout))):
+            # Прогревает другая реплика или воркер: ждём, пока она снимет блокировку
+            while await self.redis_client.exists(WARMUP_LOCK_KEY):
+                await asyncio.sleep(0.5)
+            return
+        try:
+            if snapshot_path and os.path.exists(snapshot_path):
+                restored = await import_snapshot(self.redis_client, snapshot_path)
+                logger.info(f"Restored {restored} keys from cache snapshot {snapshot_path}")
+            await self.prefetch()
+        finally:
+            await self.redis_client.delete(WARMUP_LOCK_KEY)
+
+    async def prefetch(self):
+        if self.top_n <= 0:
+            return
+        # Ключи по названию пропускаем, как и refresh-ahead: провайдеру ушло бы нормализованное название
+        cache_keys = [key for key in await self.get_popular(self.top_n) if is_city_id_key(key)]
+        if not cache_keys:
+            return
+        fetched_at = await self.get_fetched_at(cache_keys)
+        deadline = time.time() - self.soft_ttl
+        due = [key for key, ts in zip(cache_keys, fetched_at) if ts is None or ts <= deadline]
+        logger.info(f"Cache warm-up: prefetching {len(due)} of {len(cache_keys)} popular keys")
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def warm_one(cache_key):
+            async with semaphore:
+                await self.refresh(*split_cache_key(cache_key), cache_key)
+
+        await asyncio.gather(*[warm_one(key) for key in due])
+
+
+def open_snapshot(path, mode):
+    return gzip.open(path, mode + "t", encoding="utf-8") if path.endswith(".gz") else open(path, mode, encoding="utf-8")
+
+
+async def export_snapshot(redis_client, path, batch_size=500):
+    exported_at = time.time()
+    count = 0
+    with open_snapshot(path, "w") as f:
+        batch = []
+        async for cache_key in redis_client.scan_iter("provider:*", count=batch_size):
+            batch.append(cache_key)
+            if len(batch) >= batch_size:
+                count += await _export_batch(redis_client, f, batch, exported_at)
+                batch = []
+        if batch:
+            count += await _export_batch(redis_client, f, batch, exported_at)
+        f.write(json.dumps({"type": "hash", "key": CITY_ALIAS_KEY, "value": await redis_client.hgetall(CITY_ALIAS_KEY)}) + "\n")
+        await top_popular(redis_client, 0, exported_at)
+        popularity = await redis_client.zrevrange(POPULARITY_KEY, 0, -1, withscores=True)
+        f.write(json.dumps({"type": "zset", "key": POPULARITY_KEY, "value": dict(popularity)}) + "\n")
+    return count
+
+
+async def _export_batch(redis_client, f, cache_keys, exported_at):
+    async with redis_client.pipeline(transaction=False) as pipe:
+        pipe.mget(cache_keys)
+        for cache_key in cache_keys:
+            pipe.pttl(cache_key)
+        values, *ttls = await pipe.execute()
+    count = 0
+    for cache_key, value, ttl_ms in zip(cache_keys, values, ttls):
+        if value is not None and ttl_ms > 0:
+            f.write(json.dumps({"type": "string", "key": cache_key, "value": value,
+                                "ttl_ms": ttl_ms, "exported_at": exported_at}) + "\n")
+            count += 1
+    return count
+
+
+async def import_snapshot(redis_client, path):
+    # Срок жизни записи — остаток TTL на момент экспорта минус прошедшее время;
+    # существующие ключи не перезаписываются (NX), они не старше снимка
+    now = time.time()
+    count = 0
+    with open_snapshot(path, "r") as f:
+        async with redis_client.pipeline(transaction=False) as pipe:
+            for line in f:
+                record = json.loads(line)
+                if record["type"] == "string":
+                    ttl_ms = int(record["ttl_ms"] - (now - record["exported_at"]) * 1000)
+                    if ttl_ms > 0:
+                        pipe.set(record["key"], record["value"], px=ttl_ms, nx=True)
+                        count += 1
+                elif record["type"] == "hash" and record["value"]:
+                    pipe.hset(record["key"], mapping=record["value"])
+                elif record["type"] == "zset" and record["key"] == POPULARITY_KEY and record["value"]:
+                    bucket = popularity_bucket(now)
+                    pipe.zadd(bucket, record["value"], gt=True)
+                    pipe.expire(bucket, POPULARITY_WINDOW_HOURS * 3600)
+                if len(pipe) >= 500:
+                    await pipe.execute()
+            await pipe.execute()
+    return count
+
+
+async def main(args):
+    import redis.asyncio as aioredis
+
+    redis_client = aioredis.Redis(
+        host=os.getenv("REDIS_HOST", "localhost"), port=int(os.getenv("REDIS_PORT", "6379")), decode_responses=True
+    )
+    try:
+        if args.command == "export":
+            print(f"Exported {await export_snapshot(redis_client, args.path)} cache entries to {args.path}")
+        else:
+            print(f"Imported {await import_snapshot(redis_client, args.path)} cache entries from {args.path}")
+    finally:
+        await redis_client.aclose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export or import a forecast cache snapshot")
+    parser.add_argument("command", choices=["export", "import"])
+    parser.add_argument("path", help="Snapshot file (.jsonl or .jsonl.gz)")
+    asyncio.run(main(parser.parse_args()))
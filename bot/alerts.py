@@ -0,0 +1,119 @@
+import asyncio
+import logging
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+# Подписки на оповещения: множество chat_id на город и множество городов, на которые кто-то подписан
+SUBSCRIBERS_KEY_PREFIX = "bot_subscriptions:"
+SUBSCRIBED_CITIES_KEY = "bot_subscriptions"
+
+
+def normalize_city(city):
+    return " ".join(city.split()).casefold()
+
+
+def significant_change(previous, current, temp_delta):
+    # previous/current — (преобладающее описание, средняя температура) на сегодня
+    return previous[0] != current[0] or abs(current[1] - previous[1]) >= temp_delta
+
+
+class ForecastAlerts:
+    # Оповещения подписчикам при заметном изменении прогноза на сегодня.
+    # Все подписанные города слушаются через /forecast/stream бэкенда (по stream_max_cities
+    # городов на соединение); при изменении набора городов потоки открываются заново.
+    # Первое событие по городу только запоминается как исходное значение.
+
+    def __init__(self, redis_client, backend_client, temp_delta, lang="ru", stream_max_cities=50, retry_interval=5.0):
+        self.redis_client = redis_client
+        self.backend_client = backend_client
+        self.temp_delta = temp_delta
+        self.lang = lang
+        self.stream_max_cities = stream_max_cities
+        self.retry_interval = retry_interval
+        self._last = {}
+        self._changed = asyncio.Event()
+        self._task = None
+
+    async def subscribe(self, chat_id, city):
+        # Город сначала проверяется запросом прогноза: неизвестный город — BackendError, подписки нет
+        await self.backend_client.get_forecast(city, lang=self.lang, days=1)
+        city = normalize_city(city)
+        async with self.redis_client.pipeline(transaction=True) as pipe:
+            pipe.sadd(SUBSCRIBERS_KEY_PREFIX + city, chat_id)
+            pipe.sadd(SUBSCRIBED_CITIES_KEY, city)
+            added, new_city = await pipe.execute()
+        if new_city:
+            self._changed.set()
+        return bool(added)
+
+    async def unsubscribe(self, chat_id, city):
+        city = normalize_city(city)
+        removed = await self.redis_client.srem(SUBSCRIBERS_KEY_PREFIX + city, chat_id)
+        if not await self.redis_client.scard(SUBSCRIBERS_KEY_PREFIX + city):
+            await self.redis_client.srem(SUBSCRIBED_CITIES_KEY, city)
+            self._last.pop(city, None)
+            self._changed.set()
+        return bool(removed)
+
+    def start(self, notify):
+        # notify(chat_id, data, previous) — отправка оповещения, data — событие forecast бэкенда
+        self._task = asyncio.create_task(self.run(notify))
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def run(self, notify):
+        while True:
+            self._changed.clear()
+            try:
+                cities = sorted(await self.redis_client.smembers(SUBSCRIBED_CITIES_KEY))
+            except redis.exceptions.ConnectionError as e:
+                logger.warning(f"Redis connection error on subscriptions load: {e}")
+                await asyncio.sleep(self.retry_interval)
+                continue
+            if not cities:
+                await self._changed.wait()
+                continue
+
+            chunks = [cities[i:i + self.stream_max_cities] for i in range(0, len(cities), self.stream_max_cities)]
+            streams = [asyncio.create_task(self._listen(chunk, notify)) for chunk in chunks]
+            changed = asyncio.create_task(self._changed.wait())
+            done, _ = await asyncio.wait([*streams, changed], return_when=asyncio.FIRST_COMPLETED)
+            for task in [*streams, changed]:
+                task.cancel()
+            await asyncio.gather(*streams, changed, return_exceptions=True)
+            if changed in done:
+                continue
+            for task in done:
+                if task.exception() is not None:
+                    logger.warning(f"Forecast alerts stream lost: {task.exception()!r}")
+            # Поток закрылся или оборвался: переподключаемся через retry_interval
+            await asyncio.sleep(self.retry_interval)
+
+    async def _listen(self, cities, notify):
+        async for event, data in self.backend_client.stream_forecasts(cities, lang=self.lang, days=1):
+            if event == "forecast" and data.get("forecast"):
+                await self._handle(data, notify)
+
+    async def _handle(self, data, notify):
+        city = data["query"]
+        today = data["forecast"][0]
+        current = (today["dominant_description"], today["temp_avg"])
+        previous = self._last.get(city)
+        self._last[city] = current
+        if previous is None or not significant_change(previous, current, self.temp_delta):
+            return
+        chat_ids = await self.redis_client.smembers(SUBSCRIBERS_KEY_PREFIX + city)
+        logger.info(f"Forecast for {city} changed {previous} -> {current}, notifying {len(chat_ids)} chats")
+        for chat_id in chat_ids:
+            try:
+                await notify(int(chat_id), data, previous)
+            except Exception as e:
+                logger.error(f"Failed to send forecast alert to {chat_id}: {e}")
@@ -0,0 +1,108 @@
+import asyncio
+import json
+import logging
+import os
+import random
+from collections import OrderedDict
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+BACKEND_TIMEOUT = float(os.getenv("BACKEND_TIMEOUT", "10"))
+BACKEND_CONNECT_TIMEOUT = float(os.getenv("BACKEND_CONNECT_TIMEOUT", "3"))
+BACKEND_MAX_CONNECTIONS = int(os.getenv("BACKEND_MAX_CONNECTIONS", "50"))
+BACKEND_RETRIES = int(os.getenv("BACKEND_RETRIES", "2"))
+BACKEND_RETRY_BACKOFF = float(os.getenv("BACKEND_RETRY_BACKOFF", "0.3"))
+# Сколько последних ответов с ETag хранить для условных запросов (If-None-Match)
+BACKEND_ETAG_CACHE_SIZE = int(os.getenv("BACKEND_ETAG_CACHE_SIZE", "256"))
+# Поток /forecast/stream шлёт keepalive каждые 15 с: дольше тишины — соединение считается оборванным
+BACKEND_STREAM_READ_TIMEOUT = float(os.getenv("BACKEND_STREAM_READ_TIMEOUT", "60"))
+
+
+class BackendError(Exception):
+    pass
+
+
+class BackendClient:
+    # Общий асинхронный клиент бэкенда: пул keep-alive соединений, таймауты
+    # и повтор с экспоненциальной задержкой при сетевых ошибках и ответах 5xx.
+    # Ответы с ETag запоминаются: повторный запрос идёт с If-None-Match, и на 304 тело не передаётся.
+
+    def __init__(self, base_url, transport=None):
+        self._client = httpx.AsyncClient(
+            base_url=base_url,
+            timeout=httpx.Timeout(BACKEND_TIMEOUT, connect=BACKEND_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=BACKEND_MAX_CONNECTIONS),
+            transport=transport,
+        )
+        self._etags = OrderedDict()
+
+    async def _get(self, path, params):
+        cache_key = (path, tuple(sorted(params.items())))
+        cached = self._etags.get(cache_key)
+        headers = {"If-None-Match": cached[0]} if cached else None
+        for attempt in range(BACKEND_RETRIES + 1):
+            try:
+                response = await self._client.get(path, params=params, headers=headers)
+                if response.status_code == 304 and cached:
+                    self._etags.move_to_end(cache_key)
+                    return cached[1]
+                if response.status_code < 500 or attempt == BACKEND_RETRIES:
+                    response.raise_for_status()
+                    data = response.json()
+                    self._remember(cache_key, response.headers.get("etag"), data)
+                    return data
+                logger.warning(f"Backend returned {response.status_code} for {path}, retrying")
+            except httpx.HTTPStatusError as e:
+                raise BackendError(f"Backend returned {e.response.status_code} for {path}") from e
+            except httpx.TransportError as e:
+                if attempt == BACKEND_RETRIES:
+                    raise BackendError(f"Backend request to {path} failed: {e!r}") from e
+                logger.warning(f"Backend request to {path} failed: {e!r}, retrying")
+            await asyncio.sleep(BACKEND_RETRY_BACKOFF * 2 ** attempt * random.uniform(0.5, 1.5))
+
+    def _remember(self, cache_key, etag, data):
+        if not etag or BACKEND_ETAG_CACHE_SIZE <= 0:
+            return
+        self._etags[cache_key] = (etag, data)
+        self._etags.move_to_end(cache_key)
+        while len(self._etags) > BACKEND_ETAG_CACHE_SIZE:
+            self._etags.popitem(last=False)
+
+    async def get_forecast(self, city, lang="ru", days=None):
+        params = {"lang": lang}
+        if days:
+            params["days"] = days
+        return await self._get(f"/forecast/{city}", params)
+
+    async def get_history(self, limit=10):
+        return await self._get("/weather_history", {"limit": limit})
+
+    async def stream_forecasts(self, cities, lang="ru", days=None):
+        # Подписка на обновления прогнозов (server-sent events): отдаёт пары (event, data).
+        # Обрыв соединения — BackendError, переподключается вызывающий
+        params = {"cities": ",".join(cities), "lang": lang}
+        if days:
+            params["days"] = days
+        timeout = httpx.Timeout(BACKEND_TIMEOUT, connect=BACKEND_CONNECT_TIMEOUT, read=BACKEND_STREAM_READ_TIMEOUT)
+        try:
+            async with self._client.stream("GET", "/forecast/stream", params=params, timeout=timeout) as response:
+                response.raise_for_status()
+                event, data = "message", []
+                async for line in response.aiter_lines():
+                    if not line:
+                        if data:
+                            yield event, json.loads("\n".join(data))
+                        event, data = "message", []
+                    elif line.startswith("event:"):
+                        event = line[len("event:"):].strip()
+                    elif line.startswith("data:"):
+                        data.append(line[len("data:"):].lstrip())
+        except httpx.HTTPStatusError as e:
+            raise BackendError(f"Backend returned {e.response.status_code} for /forecast/stream") from e
+        except httpx.TransportError as e:
+            raise BackendError(f"Forecast stream failed: {e!r}") from e
+
+    async def aclose(self):
+        await self._client.aclose()
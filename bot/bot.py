@@ -2,11 +2,15 @@ import os
 import json
 import logging
 from datetime import datetime
-import requests
 import redis
+import redis.asyncio as aioredis
+from prometheus_client import start_http_server
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes, CallbackQueryHandler
 import emoji
+from backend_client import BackendClient, BackendError
+from log_sink import BufferedLogSink
+from alerts import ForecastAlerts
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
@@ -17,15 +21,43 @@ TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
 BACKEND_URL = os.getenv("BACKEND_URL", "http://backend:8000")
 REDIS_HOST = os.getenv("REDIS_HOST", "redis")
 REDIS_PORT = os.getenv("REDIS_PORT", 6379)
+METRICS_PORT = int(os.getenv("METRICS_PORT", "8001"))
+
+# Буферизованная запись логов запросов: размер пакета, период сброса и предел буфера
+LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", "50"))
+LOG_FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", "1"))
+LOG_MAX_BUFFER = int(os.getenv("LOG_MAX_BUFFER", "10000"))
+# Необязательное долговременное хранение логов для аналитики: Redis stream и/или JSONL-файл
+LOG_STREAM_KEY = os.getenv("LOG_STREAM_KEY")
+LOG_STREAM_MAXLEN = int(os.getenv("LOG_STREAM_MAXLEN", "100000"))
+LOG_FILE = os.getenv("LOG_FILE")
+# Оповещения по подписке (/subscribe): при смене описания погоды на сегодня
+# или изменении средней температуры не меньше чем на ALERT_TEMP_DELTA градусов
+ALERT_TEMP_DELTA = float(os.getenv("ALERT_TEMP_DELTA", "3"))
 
 if not TELEGRAM_TOKEN:
     logger.error("TELEGRAM_TOKEN environment variable is not set")
     raise ValueError("TELEGRAM_TOKEN environment variable is not set")
 
-redis_client = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
+redis_client = aioredis.Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
+backend_client = BackendClient(BACKEND_URL)
 
 LOG_KEY = "bot_request_logs"
 
+log_sink = BufferedLogSink(
+    redis_client,
+    LOG_KEY,
+    keep_last=1000,
+    batch_size=LOG_BATCH_SIZE,
+    flush_interval=LOG_FLUSH_INTERVAL,
+    max_buffer=LOG_MAX_BUFFER,
+    stream_key=LOG_STREAM_KEY,
+    stream_maxlen=LOG_STREAM_MAXLEN,
+    file_path=LOG_FILE,
+)
+
+forecast_alerts = ForecastAlerts(redis_client, backend_client, temp_delta=ALERT_TEMP_DELTA)
+
 # Обновлённый маппинг погодных условий на эмодзи
 WEATHER_EMOJIS = {
     "clear": "☀️",
@@ -79,7 +111,7 @@ def get_flag_emoji(country_code: str) -> str:
     except Exception:
         return ""
 
-# Логирование запросов и ответов в Redis
+# Логирование запросов и ответов: запись уходит в буфер, в Redis — пакетами в фоне
 def log_request_response(user_id, request_data, response_data):
     log_entry = {
         "timestamp": datetime.utcnow().isoformat(),
@@ -87,11 +119,7 @@ def log_request_response(user_id, request_data, response_data):
         "request": request_data,
         "response": response_data
     }
-    try:
-        redis_client.lpush(LOG_KEY, json.dumps(log_entry, ensure_ascii=False))
-        redis_client.ltrim(LOG_KEY, 0, 999)
-    except redis.RedisError as e:
-        logger.error(f"Failed to log request/response to Redis: {e}")
+    log_sink.emit(json.dumps(log_entry, ensure_ascii=False))
 
 # Обработчик команды /start
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -136,7 +164,7 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
 # Обработчик команды /about
 async def about_bot(update: Update, context: ContextTypes.DEFAULT_TYPE, from_callback=False):
     user_id = update.effective_user.id
-    message = "Я бот для получения прогноза погоды! Используй кнопки, чтобы:\n- Узнать погоду по городу\n- Посмотреть прогноз на 7/14/30 дней\n- Посмотреть историю поиска\nСоздан для проекта weather_service."
+    message = "Я бот для получения прогноза погоды! Используй кнопки, чтобы:\n- Узнать погоду по городу\n- Посмотреть прогноз на 7/14/30 дней\n- Посмотреть историю поиска\n- Подписаться на изменения прогноза: /subscribe <город>\nСоздан для проекта weather_service."
     if from_callback:
         await update.callback_query.message.reply_text(message)
     else:
@@ -148,9 +176,7 @@ async def about_bot(update: Update, context: ContextTypes.DEFAULT_TYPE, from_cal
 async def show_history(update: Update, context: ContextTypes.DEFAULT_TYPE, from_callback=False):
     user_id = update.effective_user.id
     try:
-        response = requests.get(f"{BACKEND_URL}/weather_history", params={"limit": 14})
-        response.raise_for_status()
-        history = response.json().get("history", [])
+        history = (await backend_client.get_history(limit=14)).get("history", [])
 
         if not history:
             message = "История поиска пуста."
@@ -173,7 +199,7 @@ async def show_history(update: Update, context: ContextTypes.DEFAULT_TYPE, from_
             await update.message.reply_text(message)
         
         log_request_response(user_id, {"action": "show_history"}, {"message": message})
-    except requests.RequestException as e:
+    except BackendError as e:
         logger.error(f"Failed to fetch history: {e}")
         message = "Не удалось загрузить историю поиска."
         if from_callback:
@@ -192,31 +218,14 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if 'forecast_days' in context.user_data:
         days = context.user_data['forecast_days']
         try:
-            response = requests.get(f"{BACKEND_URL}/forecast/{city}", params={"days": days, "lang": lang})
-            response.raise_for_status()
-            data = response.json()
+            data = await backend_client.get_forecast(city, lang=lang, days=days)
 
             message = f"{emoji.emojize(':calendar:')} Прогноз на {days} дней для {city}:\n"
             country_code = data.get("country", "")
             flag_emoji = get_flag_emoji(country_code)
 
-            # Группируем прогноз по дням и выбираем одну запись на день (ближайшую к 12:00)
-            forecast_dict = {}
-            for forecast in data["forecast"]:
-                forecast_date = datetime.strptime(forecast["date"], "%Y-%m-%d %H:%M:%S")
-                day_key = forecast_date.strftime("%Y-%m-%d")
-                if day_key not in forecast_dict:
-                    forecast_dict[day_key] = forecast
-                # Выбираем запись ближе к 12:00
-                current_hour = forecast_date.hour
-                existing_hour = datetime.strptime(forecast_dict[day_key]["date"], "%Y-%m-%d %H:%M:%S").hour
-                if abs(12 - current_hour) < abs(12 - existing_hour):
-                    forecast_dict[day_key] = forecast
-
-            # Преобразуем в список и ограничиваем по дням
-            forecast_list = list(forecast_dict.values())
-            if len(forecast_list) > days:
-                forecast_list = forecast_list[:days]
+            # Бэкенд уже возвращает одну запись на день (ближайшую к 12:00), не больше days
+            forecast_list = data["forecast"]
 
             for forecast in forecast_list:
                 date = forecast.get("date", "N/A")
@@ -232,7 +241,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             # Сбрасываем выбор периода
             del context.user_data['forecast_days']
 
-        except requests.RequestException as e:
+        except BackendError as e:
             logger.error(f"Failed to fetch forecast for {city}: {e}")
             message = "Не удалось найти город или получить прогноз. Попробуйте снова."
             await update.message.reply_text(message)
@@ -241,27 +250,14 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     # Текущая погода (поиск без прогноза)
     try:
-        response = requests.get(f"{BACKEND_URL}/forecast/{city}", params={"lang": lang})
-        response.raise_for_status()
-        data = response.json()
+        data = await backend_client.get_forecast(city, lang=lang, days=1)
 
         message = f"Погода в {data['city']}:\n"
         country_code = data.get("country", "")
         flag_emoji = get_flag_emoji(country_code)
 
-        # Группируем прогноз по дням и выбираем одну запись на день (ближайшую к 12:00) для текущего дня
-        forecast_dict = {}
-        for forecast in data["forecast"]:
-            forecast_date = datetime.strptime(forecast["date"], "%Y-%m-%d %H:%M:%S")
-            day_key = forecast_date.strftime("%Y-%m-%d")
-            if day_key not in forecast_dict:
-                forecast_dict[day_key] = forecast
-            current_hour = forecast_date.hour
-            existing_hour = datetime.strptime(forecast_dict[day_key]["date"], "%Y-%m-%d %H:%M:%S").hour
-            if abs(12 - current_hour) < abs(12 - existing_hour):
-                forecast_dict[day_key] = forecast
-
-        forecast_list = list(forecast_dict.values())[:1]  # Берем только первый день
+        # Бэкенд уже агрегирует по дням: первая запись — текущий день
+        forecast_list = data["forecast"][:1]
 
         for forecast in forecast_list:
             date = forecast.get("date", "N/A")
@@ -274,22 +270,99 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(message)
         log_request_response(user_id, {"city": city, "lang": lang}, {"message": message})
 
-    except requests.RequestException as e:
+    except BackendError as e:
         logger.error(f"Failed to fetch weather for {city}: {e}")
         message = "Не удалось найти город. Попробуйте снова (например, Moscow)."
         await update.message.reply_text(message)
         log_request_response(user_id, {"city": city, "lang": lang}, {"message": message, "error": str(e)})
 
+# Обработчики команд /subscribe <город> и /unsubscribe <город>
+async def subscribe(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = update.effective_user.id
+    city = " ".join(context.args).strip()
+    error = None
+    if not city:
+        message = "Укажите город: /subscribe Moscow"
+    else:
+        try:
+            if await forecast_alerts.subscribe(update.effective_chat.id, city):
+                message = f"Вы подписались на изменения прогноза для {city}."
+            else:
+                message = f"Вы уже подписаны на {city}."
+        except BackendError as e:
+            logger.error(f"Failed to subscribe to {city}: {e}")
+            message = "Не удалось найти город. Попробуйте снова (например, /subscribe Moscow)."
+            error = e
+        except redis.exceptions.RedisError as e:
+            logger.error(f"Failed to save subscription to {city}: {e}")
+            message = "Не удалось сохранить подписку. Попробуйте позже."
+            error = e
+    await update.message.reply_text(message)
+    response = {"message": message, "error": str(error)} if error else {"message": message}
+    log_request_response(user_id, {"command": "/subscribe", "city": city}, response)
+
+async def unsubscribe(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = update.effective_user.id
+    city = " ".join(context.args).strip()
+    error = None
+    if not city:
+        message = "Укажите город: /unsubscribe Moscow"
+    else:
+        try:
+            if await forecast_alerts.unsubscribe(update.effective_chat.id, city):
+                message = f"Подписка на {city} отменена."
+            else:
+                message = f"Вы не подписаны на {city}."
+        except redis.exceptions.RedisError as e:
+            logger.error(f"Failed to remove subscription to {city}: {e}")
+            message = "Не удалось отменить подписку. Попробуйте позже."
+            error = e
+    await update.message.reply_text(message)
+    response = {"message": message, "error": str(error)} if error else {"message": message}
+    log_request_response(user_id, {"command": "/unsubscribe", "city": city}, response)
+
+async def start_background_services(application: Application):
+    log_sink.start()
+
+    async def send_forecast_alert(chat_id, data, previous):
+        today = data["forecast"][0]
+        description = today["dominant_description"]
+        message = (
+            f"{emoji.emojize(':bell:')} Прогноз для {data['city']} изменился:\n"
+            f"{get_flag_emoji(data.get('country', ''))} {today['date']}: {get_weather_emoji(description)} {description}, "
+            f"{today['temp_avg']}°C (было: {previous[0]}, {previous[1]}°C)"
+        )
+        await application.bot.send_message(chat_id, message)
+
+    forecast_alerts.start(send_forecast_alert)
+
+async def stop_background_services(application: Application):
+    await forecast_alerts.close()
+    await log_sink.close()
+    await backend_client.aclose()
+    await redis_client.aclose()
+
 # Основная функция
 def main():
-    application = Application.builder().token(TELEGRAM_TOKEN).build()
+    # concurrent_updates: медленный ответ бэкенда одному пользователю не задерживает остальных
+    application = (
+        Application.builder()
+        .token(TELEGRAM_TOKEN)
+        .concurrent_updates(True)
+        .post_init(start_background_services)
+        .post_shutdown(stop_background_services)
+        .build()
+    )
 
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("history", show_history))
     application.add_handler(CommandHandler("about", about_bot))
+    application.add_handler(CommandHandler("subscribe", subscribe))
+    application.add_handler(CommandHandler("unsubscribe", unsubscribe))
     application.add_handler(CallbackQueryHandler(button_handler))
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
 
+    start_http_server(METRICS_PORT)
     logger.info("Starting Telegram bot...")
     application.run_polling(allowed_updates=Update.ALL_TYPES)
 
@@ -0,0 +1,121 @@
+import asyncio
+import logging
+from collections import deque
+
+import redis
+from prometheus_client import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+log_entries_flushed = Counter(
+    "bot_log_entries_flushed_total",
+    "Total number of request log entries written to Redis"
+)
+log_entries_dropped = Counter(
+    "bot_log_entries_dropped_total",
+    "Total number of request log entries dropped because the buffer was full",
+    ["reason"]
+)
+log_buffer_size = Gauge(
+    "bot_log_buffer_size",
+    "Number of request log entries waiting to be flushed"
+)
+
+
+class BufferedLogSink:
+    # Копит записи лога в памяти и сбрасывает их в Redis пакетами (один pipeline
+    # на пакет) по достижении batch_size или раз в flush_interval секунд.
+    # Буфер ограничен max_buffer: если Redis не успевает, новые записи отбрасываются.
+    # В файл каждая запись дописывается один раз, при первой попытке сброса; повтор
+    # после ошибки Redis файл уже не трогает. В буфере — пары (запись, уже в файле).
+
+    def __init__(self, redis_client, key, keep_last=1000, batch_size=50, flush_interval=1.0,
+                 max_buffer=10000, stream_key=None, stream_maxlen=100000, file_path=None):
+        self.redis_client = redis_client
+        self.key = key
+        self.keep_last = keep_last
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.stream_key = stream_key
+        self.stream_maxlen = stream_maxlen
+        self.file_path = file_path
+        self._buffer = deque()
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._closing = False
+
+    def emit(self, entry):
+        # entry — уже сериализованная в JSON строка
+        if len(self._buffer) >= self.max_buffer:
+            log_entries_dropped.labels(reason="buffer_full").inc()
+            return
+        self._buffer.append((entry, False))
+        log_buffer_size.set(len(self._buffer))
+        if len(self._buffer) >= self.batch_size:
+            self._wakeup.set()
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        # Не отменяем задачу посреди записи: просим её дописать буфер и завершиться
+        self._closing = True
+        self._wakeup.set()
+        if self._task is not None:
+            await self._task
+
+    async def _run(self):
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            while self._buffer:
+                if not await self.flush() or (len(self._buffer) < self.batch_size and not self._closing):
+                    break
+        # Остановка: дописываем остаток буфера, пока Redis принимает пакеты
+        while self._buffer and await self.flush():
+            pass
+
+    async def flush(self):
+        batch = [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+        log_buffer_size.set(len(self._buffer))
+        if not batch:
+            return True
+
+        to_file = [entry for entry, in_file in batch if not in_file]
+        batch = [entry for entry, _ in batch]
+        if self.file_path and to_file:
+            try:
+                await asyncio.to_thread(self._append_to_file, to_file)
+            except OSError as e:
+                # Ошибка файла не повторяется: файл — дополнительная копия, основная запись в Redis
+                logger.error(f"Failed to append request logs to {self.file_path}: {e}")
+
+        try:
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                pipe.lpush(self.key, *batch)
+                pipe.ltrim(self.key, 0, self.keep_last - 1)
+                if self.stream_key:
+                    for entry in batch:
+                        pipe.xadd(self.stream_key, {"entry": entry}, maxlen=self.stream_maxlen, approximate=True)
+                await pipe.execute()
+        except redis.RedisError as e:
+            logger.error(f"Failed to flush {len(batch)} request logs to Redis: {e}")
+            # Возвращаем пакет в начало буфера, если там есть место, иначе теряем его
+            free = self.max_buffer - len(self._buffer)
+            if free < len(batch):
+                log_entries_dropped.labels(reason="redis_error").inc(len(batch) - max(free, 0))
+                batch = batch[len(batch) - max(free, 0):]
+            self._buffer.extendleft((entry, True) for entry in reversed(batch))
+            log_buffer_size.set(len(self._buffer))
+            return False
+
+        log_entries_flushed.inc(len(batch))
+        return True
+
+    def _append_to_file(self, batch):
+        with open(self.file_path, "a", encoding="utf-8") as f:
+            f.write("\n".join(batch) + "\n")
@@ -0,0 +1,150 @@
+import asyncio
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import pytest
+
+from alerts import SUBSCRIBED_CITIES_KEY, SUBSCRIBERS_KEY_PREFIX, ForecastAlerts, significant_change
+from backend_client import BackendError
+
+
+class FakeRedis:
+    # Множества в словаре, как их видит бот (decode_responses=True)
+    def __init__(self):
+        self.sets = {}
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    async def sadd(self, key, member):
+        members = self.sets.setdefault(key, set())
+        added = str(member) not in members
+        members.add(str(member))
+        return int(added)
+
+    async def srem(self, key, member):
+        members = self.sets.get(key, set())
+        removed = str(member) in members
+        members.discard(str(member))
+        return int(removed)
+
+    async def scard(self, key):
+        return len(self.sets.get(key, ()))
+
+    async def smembers(self, key):
+        return set(self.sets.get(key, ()))
+
+
+class FakePipeline:
+    def __init__(self, redis_client):
+        self.redis_client = redis_client
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def __getattr__(self, name):
+        return lambda *args: self.commands.append((name, args))
+
+    async def execute(self):
+        return [await getattr(self.redis_client, name)(*args) for name, args in self.commands]
+
+
+class FakeBackend:
+    def __init__(self, known=(), events=()):
+        self.known = set(known)
+        self.events = list(events)
+        self.forecast_calls = []
+
+    async def get_forecast(self, city, lang="ru", days=None):
+        self.forecast_calls.append(city)
+        if city not in self.known:
+            raise BackendError(f"Backend returned 404 for /forecast/{city}")
+        return {"city": city, "forecast": []}
+
+    async def stream_forecasts(self, cities, lang="ru", days=None):
+        for event in self.events:
+            yield event
+
+
+def forecast_event(city, description, temp):
+    return "forecast", {"query": city, "forecast": [{"dominant_description": description, "temp_avg": temp}]}
+
+
+def test_significant_change():
+    assert significant_change(("ясно", 10.0), ("дождь", 10.0), temp_delta=3)
+    assert significant_change(("ясно", 10.0), ("ясно", 13.0), temp_delta=3)
+    assert significant_change(("ясно", 10.0), ("ясно", 6.5), temp_delta=3)
+    assert not significant_change(("ясно", 10.0), ("ясно", 12.9), temp_delta=3)
+
+
+def test_subscribe_checks_city_and_stores_normalized_name():
+    redis_client = FakeRedis()
+    backend = FakeBackend(known={"Moscow", " moscow "})
+    alerts = ForecastAlerts(redis_client, backend, temp_delta=3)
+
+    async def scenario():
+        with pytest.raises(BackendError):
+            await alerts.subscribe(1, "Atlantis")
+        assert redis_client.sets == {}
+
+        assert await alerts.subscribe(1, "Moscow") is True
+        assert await alerts.subscribe(1, " moscow ") is False
+        assert await alerts.subscribe(2, "Moscow") is True
+        assert redis_client.sets == {SUBSCRIBERS_KEY_PREFIX + "moscow": {"1", "2"}, SUBSCRIBED_CITIES_KEY: {"moscow"}}
+
+        assert await alerts.unsubscribe(1, "Moscow") is True
+        assert await alerts.unsubscribe(1, "Moscow") is False
+        assert await redis_client.smembers(SUBSCRIBED_CITIES_KEY) == {"moscow"}
+        # Ушёл последний подписчик — город больше не слушается
+        assert await alerts.unsubscribe(2, "Moscow") is True
+        assert await redis_client.smembers(SUBSCRIBED_CITIES_KEY) == set()
+
+    asyncio.run(scenario())
+    assert backend.forecast_calls == ["Atlantis", "Moscow", " moscow ", "Moscow"]
+
+
+def test_listen_notifies_subscribers_only_on_significant_change():
+    redis_client = FakeRedis()
+    redis_client.sets[SUBSCRIBERS_KEY_PREFIX + "moscow"] = {"1", "2"}
+    backend = FakeBackend(events=[
+        forecast_event("moscow", "ясно", 10.0),
+        forecast_event("moscow", "ясно", 11.0),
+        ("error", {"query": "moscow", "status": 503, "detail": "Weather provider is temporarily unavailable"}),
+        forecast_event("moscow", "дождь", 11.5),
+        forecast_event("moscow", "дождь", 15.0),
+    ])
+    alerts = ForecastAlerts(redis_client, backend, temp_delta=3)
+    sent = []
+
+    async def notify(chat_id, data, previous):
+        sent.append((chat_id, data["forecast"][0]["temp_avg"], previous))
+
+    asyncio.run(alerts._listen(["moscow"], notify))
+
+    # Первое событие — исходное значение, второе — изменение меньше порога
+    assert sorted(sent) == [
+        (1, 11.5, ("ясно", 11.0)), (1, 15.0, ("дождь", 11.5)),
+        (2, 11.5, ("ясно", 11.0)), (2, 15.0, ("дождь", 11.5)),
+    ]
+
+
+def test_notify_failure_does_not_stop_other_chats():
+    redis_client = FakeRedis()
+    redis_client.sets[SUBSCRIBERS_KEY_PREFIX + "moscow"] = {"1", "2"}
+    backend = FakeBackend(events=[forecast_event("moscow", "ясно", 10.0), forecast_event("moscow", "снег", 0.0)])
+    alerts = ForecastAlerts(redis_client, backend, temp_delta=3)
+    sent = []
+
+    async def notify(chat_id, data, previous):
+        if chat_id == 1:
+            raise RuntimeError("chat not found")
+        sent.append(chat_id)
+
+    asyncio.run(alerts._listen(["moscow"], notify))
+    assert sent == [2]
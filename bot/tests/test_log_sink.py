@@ -0,0 +1,103 @@
+import asyncio
+import json
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import redis
+from prometheus_client import REGISTRY
+
+from log_sink import BufferedLogSink
+
+
+class FlakyRedis:
+    # Первые failures пакетов падают с ConnectionError, остальные записываются в pushed
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.pushed = []
+
+    def pipeline(self, transaction=True):
+        return FlakyPipeline(self)
+
+
+class FlakyPipeline:
+    def __init__(self, redis_client):
+        self.redis_client = redis_client
+        self.entries = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def lpush(self, key, *entries):
+        self.entries.extend(entries)
+
+    def ltrim(self, key, start, stop):
+        pass
+
+    async def execute(self):
+        await asyncio.sleep(0)
+        if self.redis_client.failures:
+            self.redis_client.failures -= 1
+            raise redis.exceptions.ConnectionError("Redis is down")
+        self.redis_client.pushed.extend(self.entries)
+
+
+def dropped(reason):
+    return REGISTRY.get_sample_value("bot_log_entries_dropped_total", {"reason": reason}) or 0
+
+
+def test_failed_flushes_requeue_batch_and_write_file_once(tmp_path):
+    redis_client = FlakyRedis(failures=2)
+    path = tmp_path / "requests.jsonl"
+    sink = BufferedLogSink(redis_client, "logs", batch_size=10, file_path=str(path))
+    entries = [json.dumps({"n": i}) for i in range(3)]
+    for entry in entries:
+        sink.emit(entry)
+
+    async def scenario():
+        assert not await sink.flush()
+        assert not await sink.flush()
+        assert await sink.flush()
+
+    asyncio.run(scenario())
+    assert redis_client.pushed == entries
+    assert path.read_text().splitlines() == entries
+
+
+def test_buffer_limit_drops_new_entries_and_requeue_overflow():
+    redis_client = FlakyRedis(failures=1)
+    sink = BufferedLogSink(redis_client, "logs", batch_size=2, max_buffer=3)
+    buffer_full, redis_error = dropped("buffer_full"), dropped("redis_error")
+    for i in range(5):
+        sink.emit(str(i))
+    assert dropped("buffer_full") - buffer_full == 2
+
+    async def scenario():
+        # Пока пакет ["0", "1"] пишется, место в буфере занимает новая запись
+        batch_flush = asyncio.ensure_future(sink.flush())
+        await asyncio.sleep(0)
+        sink.emit("5")
+        assert not await batch_flush
+
+    asyncio.run(scenario())
+    # Из неудачного пакета возвращается столько, сколько влезает в буфер
+    assert dropped("redis_error") - redis_error == 1
+    assert [entry for entry, _ in sink._buffer] == ["1", "2", "5"]
+
+
+def test_close_drains_buffer():
+    redis_client = FlakyRedis()
+    sink = BufferedLogSink(redis_client, "logs", batch_size=2, flush_interval=60)
+
+    async def scenario():
+        sink.start()
+        for i in range(5):
+            sink.emit(str(i))
+        await sink.close()
+
+    asyncio.run(scenario())
+    assert redis_client.pushed == ["0", "1", "2", "3", "4"]